@@ -1,37 +1,51 @@
 import os
 import argparse
 from pdf_extractor import PDFKnowledgeExtractor
-from kg_builder import KnowledgeGraphBuilder
+from kg_builder import KnowledgeGraphBuilder, PROVENANCE_MODES, compare_provenance_modes
 from kg_store import KnowledgeGraphStore
 from query_engine import QueryEngine
+from nlp_profiles import PROFILES
+from instrumentation import PipelineProfiler, configure_logging
 
-def process_pdfs(pdf_dir, output_dir):
+def process_pdfs(pdf_dir, output_dir, workers=1, batch_size=8, incremental=False, resolve_entities=False, **extractor_options):
     """Process PDFs and extract knowledge"""
-    extractor = PDFKnowledgeExtractor()
-    knowledge = extractor.process_directory(pdf_dir, output_dir)
+    extractor = PDFKnowledgeExtractor(**extractor_options)
+    knowledge = extractor.process_directory(pdf_dir, output_dir, n_process=workers, batch_size=batch_size,
+                                            incremental=incremental, resolve_entities=resolve_entities)
     return knowledge
 
-def build_knowledge_graph(knowledge_data, output_path):
+def build_knowledge_graph(knowledge_data, output_path, profiler=None, streaming=False, dedup="exact", provenance="reification"):
     """Build knowledge graph from extracted data"""
-    builder = KnowledgeGraphBuilder()
-    builder.build_from_extracted_data(knowledge_data)
-    builder.save_graph(output_path)
+    profiler = profiler or PipelineProfiler(enabled=False)
+    builder = KnowledgeGraphBuilder(profiler=profiler, provenance=provenance)
+    if streaming:
+        # Write N-Triples as they are generated instead of materializing the graph
+        with profiler.stage("serialization") as record:
+            record["items"] = builder.write_ntriples(knowledge_data, output_path, dedup=dedup)
+        return None
+    with profiler.stage("graph_build") as record:
+        builder.build_from_extracted_data(knowledge_data)
+        record["items"] = len(builder.g)
+    with profiler.stage("serialization", items=len(builder.g)):
+        builder.save_graph(output_path)
     return builder.g
 
-def upload_to_fuseki(graph_file):
+def upload_to_fuseki(graph_file, profiler=None, chunk_size=None, workers=4):
     """Upload knowledge graph to Fuseki"""
-    store = KnowledgeGraphStore()
-    success = store.upload_graph(graph_file=graph_file)
+    profiler = profiler or PipelineProfiler(enabled=False)
+    store = KnowledgeGraphStore(profiler=profiler)
+    with profiler.stage("upload"):
+        success = store.upload_graph(graph_file=graph_file, chunk_size=chunk_size, workers=workers)
     return success
 
-def query_interface():
+def query_interface(nlp_profile="accurate"):
     """Interactive query interface"""
-    engine = QueryEngine()
+    engine = QueryEngine(nlp_profile=nlp_profile)
     
     print("\n" + "=" * 50)
     print("Knowledge Graph Query System")
     print("=" * 50)
-    print("Type 'exit' to quit the system")
+    print("Type 'exit' to quit the system, 'stats' for result cache statistics")
     print("=" * 50)
     
     while True:
@@ -39,6 +53,10 @@ def query_interface():
         
         if question.lower() in ['exit', 'quit', 'q']:
             break
+
+        if question.lower() == 'stats':
+            print(engine.kg_store.cache_stats())
+            continue
         
         # Process the question
         print("\nProcessing your question...")
@@ -66,17 +84,24 @@ def query_interface():
         print(f"SPARQL query used: {results['sparql_query']}")
         print("-" * 50)
 
-def run_full_pipeline(pdf_dir, output_dir, graph_file):
+def run_full_pipeline(pdf_dir, output_dir, graph_file, workers=1, batch_size=8, incremental=False, resolve_entities=False,
+                      report_path=None, provenance="reification", trace_memory=False, **extractor_options):
     """Run the full pipeline from PDFs to knowledge graph"""
+    profiler = PipelineProfiler(trace_memory=trace_memory)
+
     print("Step 1: Processing PDFs...")
-    knowledge = process_pdfs(pdf_dir, output_dir)
+    knowledge = process_pdfs(pdf_dir, output_dir, workers, batch_size, incremental, resolve_entities,
+                             profiler=profiler, **extractor_options)
     
     print("\nStep 2: Building knowledge graph...")
     knowledge_file = os.path.join(output_dir, "combined_knowledge.json")
-    graph = build_knowledge_graph(knowledge_file, graph_file)
+    graph = build_knowledge_graph(knowledge_file, graph_file, profiler, provenance=provenance)
     
     print("\nStep 3: Uploading to Fuseki server...")
-    success = upload_to_fuseki(graph_file)
+    success = upload_to_fuseki(graph_file, profiler)
+
+    if report_path:
+        profiler.write_report(report_path)
     
     if success:
         print("\nKnowledge graph successfully created and uploaded!")
@@ -85,61 +110,150 @@ def run_full_pipeline(pdf_dir, output_dir, graph_file):
         print("\nError uploading to Fuseki. Please check if the server is running.")
         return False
 
+def run_streaming_pipeline(pdf_dir, output_dir, workers=1, batch_size=8, upload_batch_size=50000, save=True,
+                           report_path=None, provenance="reification", trace_memory=False, **extractor_options):
+    """Run the pipeline as a stream: each document's triples go to Fuseki without the combined JSON and TTL files"""
+    profiler = PipelineProfiler(trace_memory=trace_memory)
+    extractor = PDFKnowledgeExtractor(profiler=profiler, **extractor_options)
+    builder = KnowledgeGraphBuilder(profiler=profiler, provenance=provenance)
+    store = KnowledgeGraphStore(profiler=profiler)
+
+    knowledge_stream = extractor.iter_directory(pdf_dir, output_dir, workers, batch_size, save=save)
+    success = store.upload_triples(builder.iter_document_triples(knowledge_stream), upload_batch_size)
+
+    if report_path:
+        profiler.write_report(report_path)
+    
+    if success:
+        print("\nKnowledge graph successfully streamed to Fuseki!")
+    else:
+        print("\nError uploading to Fuseki. Please check if the server is running.")
+    return success
+
 def main():
     # Set up argument parser
     parser = argparse.ArgumentParser(description='PDF Knowledge Graph System')
+    parser.add_argument('--log-level', default='WARNING', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                        help='Pipeline log verbosity (INFO logs every stage timing, DEBUG every sentence)')
+    parser.add_argument('--backend', default=None, choices=['fuseki', 'local'],
+                        help='Where SPARQL runs: the Fuseki server or in-process on the graph file (default: $KG_BACKEND or fuseki)')
     subparsers = parser.add_subparsers(dest='command', help='Command to execute')
     
     # Full pipeline command
     pipeline_parser = subparsers.add_parser('pipeline', help='Run the full pipeline')
     pipeline_parser.add_argument('--pdf-dir', default='data/pdfs', help='Directory containing PDF files')
     pipeline_parser.add_argument('--output-dir', default='data/extracted', help='Directory for extracted data')
-    pipeline_parser.add_argument('--graph-file', default='data/knowledge_graphs/knowledge_graph.ttl', help='Output path for knowledge graph')
+    pipeline_parser.add_argument('--graph-file', default='data/knowledge_graphs/knowledge_graph.ttl', help='Output path for knowledge graph (.ttl, .nt, .nt.gz or .kgb)')
+    pipeline_parser.add_argument('--workers', type=int, default=1, help='Number of worker processes for PDF extraction')
+    pipeline_parser.add_argument('--batch-size', type=int, default=8, help='Number of PDFs per NER batch')
+    pipeline_parser.add_argument('--max-pair-distance', type=int, default=None, help='Skip entity pairs more than this many tokens apart')
+    pipeline_parser.add_argument('--max-pairs-per-sentence', type=int, default=None, help='Limit relation candidates per sentence')
+    pipeline_parser.add_argument('--incremental', action='store_true', help='Only re-extract PDFs that changed since the last run')
+    pipeline_parser.add_argument('--resolve-entities', action='store_true', help='Merge spelling variants of the same entity')
+    pipeline_parser.add_argument('--nlp-profile', default='accurate', choices=sorted(PROFILES), help='SpaCy pipeline profile for extraction')
+    pipeline_parser.add_argument('--report', default='data/reports/run_report.json', help='Output path for the JSON run report')
+    pipeline_parser.add_argument('--provenance', default='reification', choices=PROVENANCE_MODES, help="How source sentences are recorded ('sentence' needs an .nq graph file)")
+    pipeline_parser.add_argument('--trace-memory', action='store_true', help='Also report the Python allocation peak of each stage (slower)')
+    
+    # Streaming pipeline command
+    stream_parser = subparsers.add_parser('stream', help='Run the full pipeline as a stream, without intermediate combined files')
+    stream_parser.add_argument('--pdf-dir', default='data/pdfs', help='Directory containing PDF files')
+    stream_parser.add_argument('--output-dir', default='data/extracted', help='Directory for per-PDF extracted data')
+    stream_parser.add_argument('--workers', type=int, default=1, help='Number of worker processes for PDF extraction')
+    stream_parser.add_argument('--batch-size', type=int, default=8, help='Number of PDFs per NER batch')
+    stream_parser.add_argument('--upload-batch-size', type=int, default=50000, help='Triples per upload request')
+    stream_parser.add_argument('--no-save', action='store_true', help='Do not write per-PDF knowledge files')
+    stream_parser.add_argument('--max-pair-distance', type=int, default=None, help='Skip entity pairs more than this many tokens apart')
+    stream_parser.add_argument('--max-pairs-per-sentence', type=int, default=None, help='Limit relation candidates per sentence')
+    stream_parser.add_argument('--nlp-profile', default='accurate', choices=sorted(PROFILES), help='SpaCy pipeline profile for extraction')
+    stream_parser.add_argument('--report', default='data/reports/run_report.json', help='Output path for the JSON run report')
+    stream_parser.add_argument('--provenance', default='reification', choices=PROVENANCE_MODES, help="How source sentences are recorded ('sentence' needs an .nq graph file)")
+    stream_parser.add_argument('--trace-memory', action='store_true', help='Also report the Python allocation peak of each stage (slower)')
     
     # Process PDFs command
     process_parser = subparsers.add_parser('process', help='Process PDFs only')
     process_parser.add_argument('--pdf-dir', default='data/pdfs', help='Directory containing PDF files')
     process_parser.add_argument('--output-dir', default='data/extracted', help='Directory for extracted data')
+    process_parser.add_argument('--workers', type=int, default=1, help='Number of worker processes for PDF extraction')
+    process_parser.add_argument('--batch-size', type=int, default=8, help='Number of PDFs per NER batch')
+    process_parser.add_argument('--max-pair-distance', type=int, default=None, help='Skip entity pairs more than this many tokens apart')
+    process_parser.add_argument('--max-pairs-per-sentence', type=int, default=None, help='Limit relation candidates per sentence')
+    process_parser.add_argument('--incremental', action='store_true', help='Only re-extract PDFs that changed since the last run')
+    process_parser.add_argument('--resolve-entities', action='store_true', help='Merge spelling variants of the same entity')
+    process_parser.add_argument('--nlp-profile', default='accurate', choices=sorted(PROFILES), help='SpaCy pipeline profile for extraction')
     
     # Build KG command
     build_parser = subparsers.add_parser('build', help='Build knowledge graph from extracted data')
     build_parser.add_argument('--input-file', default='data/extracted/combined_knowledge.json', help='Input JSON file with extracted data')
-    build_parser.add_argument('--graph-file', default='data/knowledge_graphs/knowledge_graph.ttl', help='Output path for knowledge graph')
+    build_parser.add_argument('--graph-file', default='data/knowledge_graphs/knowledge_graph.ttl', help='Output path for knowledge graph (.ttl, .nt, .nt.gz or .kgb)')
+    build_parser.add_argument('--streaming', action='store_true', help='Write N-Triples directly without building the graph in memory')
+    build_parser.add_argument('--dedup', default='exact', choices=['exact', 'bloom', 'none'], help='How repeated triples are dropped in streaming mode')
+    build_parser.add_argument('--provenance', default='reification', choices=PROVENANCE_MODES, help="How source sentences are recorded ('sentence' needs an .nq graph file)")
+
+    # Provenance comparison command
+    provenance_parser = subparsers.add_parser('provenance-report', help='Compare graph size under each provenance mode')
+    provenance_parser.add_argument('--input-file', default='data/extracted/combined_knowledge.json', help='Input JSON file with extracted data')
     
     # Upload command
     upload_parser = subparsers.add_parser('upload', help='Upload knowledge graph to Fuseki')
-    upload_parser.add_argument('--graph-file', default='data/knowledge_graphs/knowledge_graph.ttl', help='Path to knowledge graph file')
+    upload_parser.add_argument('--graph-file', default='data/knowledge_graphs/knowledge_graph.ttl', help='Path to knowledge graph file (.ttl, .nt, .nt.gz or .kgb)')
+    upload_parser.add_argument('--chunk-size', type=int, default=None, help='Upload in gzip-compressed chunks of this many triples')
+    upload_parser.add_argument('--upload-workers', type=int, default=4, help='Concurrent connections for chunked upload')
     
     # Query command
-    subparsers.add_parser('query', help='Start interactive query interface')
+    query_parser = subparsers.add_parser('query', help='Start interactive query interface')
+    query_parser.add_argument('--nlp-profile', default='accurate', choices=sorted(PROFILES), help='SpaCy pipeline profile for question parsing')
     
     # Parse arguments
     args = parser.parse_args()
+    configure_logging(args.log_level)
+    if args.backend:
+        os.environ["KG_BACKEND"] = args.backend
     
     # Execute the appropriate command
+    if args.command in ('pipeline', 'process', 'stream'):
+        extractor_options = {
+            "max_pair_distance": args.max_pair_distance,
+            "max_pairs_per_sentence": args.max_pairs_per_sentence,
+            "nlp_profile": args.nlp_profile
+        }
+
     if args.command == 'pipeline':
-        run_full_pipeline(args.pdf_dir, args.output_dir, args.graph_file)
+        run_full_pipeline(args.pdf_dir, args.output_dir, args.graph_file, args.workers, args.batch_size,
+                          args.incremental, args.resolve_entities, args.report, provenance=args.provenance,
+                          trace_memory=args.trace_memory, **extractor_options)
+    
+    elif args.command == 'stream':
+        run_streaming_pipeline(args.pdf_dir, args.output_dir, args.workers, args.batch_size,
+                               args.upload_batch_size, not args.no_save, args.report, provenance=args.provenance,
+                               trace_memory=args.trace_memory, **extractor_options)
     
     elif args.command == 'process':
         print("Processing PDFs...")
-        process_pdfs(args.pdf_dir, args.output_dir)
+        process_pdfs(args.pdf_dir, args.output_dir, args.workers, args.batch_size,
+                     args.incremental, args.resolve_entities, **extractor_options)
         print("Processing complete!")
     
     elif args.command == 'build':
         print("Building knowledge graph...")
-        build_knowledge_graph(args.input_file, args.graph_file)
+        build_knowledge_graph(args.input_file, args.graph_file, streaming=args.streaming,
+                              dedup=None if args.dedup == 'none' else args.dedup, provenance=args.provenance)
         print(f"Knowledge graph built and saved to {args.graph_file}")
     
+    elif args.command == 'provenance-report':
+        for mode, sizes in compare_provenance_modes(args.input_file).items():
+            print(f"{mode:12} {sizes['triples']:>10} triples {sizes['ntriples_bytes']:>14} bytes (N-Triples)")
+    
     elif args.command == 'upload':
         print("Uploading knowledge graph to Fuseki...")
-        success = upload_to_fuseki(args.graph_file)
+        success = upload_to_fuseki(args.graph_file, chunk_size=args.chunk_size, workers=args.upload_workers)
         if success:
             print("Upload successful!")
         else:
             print("Upload failed. Check if Fuseki server is running.")
     
     elif args.command == 'query':
-        query_interface()
+        query_interface(args.nlp_profile)
     
     else:
         # If no command is specified, show help
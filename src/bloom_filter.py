@@ -0,0 +1,36 @@
+import math
+import hashlib
+
+class BloomFilter:
+    """Fixed-size approximate set: no false negatives, about error_rate false positives at capacity"""
+
+    def __init__(self, capacity=10_000_000, error_rate=0.001):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode("utf-8") if isinstance(item, str) else item, digest_size=16).digest()
+        # Double hashing: h1 + i * h2 gives num_hashes independent-enough positions
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, item):
+        """Add item; returns True if it was (probably) already present"""
+        present = True
+        for position in self._positions(item):
+            byte, bit = divmod(position, 8)
+            if not self.bits[byte] & (1 << bit):
+                present = False
+                self.bits[byte] |= 1 << bit
+        return present
+
+    def __contains__(self, item):
+        for position in self._positions(item):
+            byte, bit = divmod(position, 8)
+            if not self.bits[byte] & (1 << bit):
+                return False
+        return True
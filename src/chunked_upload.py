@@ -0,0 +1,174 @@
+import re
+import gzip
+import time
+from itertools import chain
+import requests
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from requests.adapters import HTTPAdapter
+from rdflib import BNode
+from nt_utils import triple_to_nt, statement_to_nq
+from instrumentation import logger
+import graph_io
+
+# Status codes worth retrying; anything else (e.g. 400 for a syntax error) fails the chunk at once
+_RETRY_STATUS = {429, 500, 502, 503, 504}
+
+# Blank node labels in an N-Triples line (a match inside a literal only joins two groups)
+_BNODE_LABEL = re.compile(r'(?:^|\s)(_:[^\s.]+(?:\.[^\s.]+)*)')
+
+def iter_graph_groups(graph):
+    """N-Triples lines of graph, one list per subject together with the blank nodes it reaches.
+
+    Blank node labels are only meaningful within one request, so a blank node and every
+    triple mentioning it must be sent in the same chunk.
+    """
+    seen_bnodes = set()
+    for subject in graph.subjects(unique=True):
+        if isinstance(subject, BNode):
+            # Sent together with the node that refers to it
+            if subject in seen_bnodes or next(graph.subjects(None, subject), None) is not None:
+                continue
+            seen_bnodes.add(subject)
+        lines = []
+        stack = [subject]
+        while stack:
+            for triple in graph.triples((stack.pop(), None, None)):
+                lines.append(triple_to_nt(triple))
+                if isinstance(triple[2], BNode) and triple[2] not in seen_bnodes:
+                    seen_bnodes.add(triple[2])
+                    stack.append(triple[2])
+        yield lines
+
+def iter_file_groups(graph_file):
+    """Lines of an N-Triples file (optionally gzipped), grouped so the lines using a blank node
+    stay together. A group starts at each line whose subject is not a blank node and that
+    mentions no blank node of the current group; the project's writers emit a blank node's
+    lines right after the line introducing it."""
+    opener = gzip.open if graph_file.lower().endswith(".gz") else open
+    with opener(graph_file, 'rt', encoding="utf-8") as f:
+        group = []
+        group_bnodes = set()
+        for line in f:
+            if not line.strip() or line.startswith("#"):
+                continue
+            bnodes = set(_BNODE_LABEL.findall(line))
+            if group and not line.startswith("_:") and not (bnodes & group_bnodes):
+                yield group
+                group = []
+                group_bnodes = set()
+            group_bnodes |= bnodes
+            group.append(line if line.endswith("\n") else line + "\n")
+        if group:
+            yield group
+
+def iter_chunks(groups, chunk_size):
+    """Concatenate line groups into chunks of at least chunk_size lines (groups are never split)"""
+    chunk = []
+    for group in groups:
+        chunk.extend(group)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+class ChunkedUploader:
+    """Uploads N-Triples to a Fuseki data endpoint as gzip-compressed chunks over a pool of
+    keep-alive connections, retrying failed chunks individually and reporting throughput.
+
+    Only `workers * 2` chunks are held in memory at a time, so the graph is never
+    serialized as a whole.
+    """
+
+    def __init__(self, data_endpoint, chunk_size=50000, workers=4, compress=True, retries=3,
+                 backoff=1.0, timeout=300):
+        self.data_endpoint = data_endpoint
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.compress = compress
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def post_chunk(self, lines):
+        """Send one chunk, retrying with exponential backoff; returns the number of attempts used"""
+        body = "".join(lines).encode("utf-8")
+        # N-Quads, so files with named graphs go through as well; N-Triples lines are valid N-Quads
+        headers = {"Content-Type": "application/n-quads"}
+        if self.compress:
+            body = gzip.compress(body, compresslevel=6)
+            headers["Content-Encoding"] = "gzip"
+
+        for attempt in range(1, self.retries + 2):
+            try:
+                response = self.session.post(self.data_endpoint, data=body, headers=headers, timeout=self.timeout)
+                if response.status_code in (200, 201, 204):
+                    return attempt
+                error = f"HTTP {response.status_code}: {response.text[:200]}"
+                if response.status_code not in _RETRY_STATUS:
+                    raise RuntimeError(error)
+            except requests.RequestException as e:
+                error = str(e)
+            if attempt <= self.retries:
+                logger.warning("Chunk of %d triples failed (%s), retry %d of %d", len(lines), error, attempt, self.retries)
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+        raise RuntimeError(f"Chunk of {len(lines)} triples failed after {self.retries + 1} attempts: {error}")
+
+    def upload(self, groups):
+        """Upload line groups (see iter_graph_groups / iter_file_groups).
+
+        Returns a stats dict: triples and chunks sent, failed chunks, retries, seconds and triples/s.
+        """
+        stats = {"triples": 0, "chunks": 0, "failed_chunks": 0, "failed_triples": 0, "retries": 0}
+        started = time.perf_counter()
+        chunks = iter_chunks(groups, self.chunk_size)
+
+        with ThreadPoolExecutor(self.workers) as pool:
+            pending = {}
+            for chunk in chunks:
+                pending[pool.submit(self.post_chunk, chunk)] = len(chunk)
+                if len(pending) >= self.workers * 2:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self._record(future, pending.pop(future), stats, started)
+            for future in list(pending):
+                self._record(future, pending.pop(future), stats, started)
+
+        stats["seconds"] = round(time.perf_counter() - started, 3)
+        stats["triples_per_second"] = round(stats["triples"] / stats["seconds"], 1) if stats["seconds"] > 0 else None
+        print(f"Uploaded {stats['triples']} triples in {stats['chunks']} chunks in {stats['seconds']}s "
+              f"({stats['triples_per_second']} triples/s), {stats['failed_chunks']} chunks failed")
+        return stats
+
+    def _record(self, future, size, stats, started):
+        try:
+            attempts = future.result()
+        except RuntimeError as e:
+            print(f"Failed to upload data: {e}")
+            stats["failed_chunks"] += 1
+            stats["failed_triples"] += size
+            return
+        stats["triples"] += size
+        stats["chunks"] += 1
+        stats["retries"] += attempts - 1
+        elapsed = time.perf_counter() - started
+        print(f"Uploaded {stats['triples']} triples ({stats['chunks']} chunks, "
+              f"{stats['triples'] / elapsed if elapsed > 0 else 0:.0f} triples/s)")
+
+    def upload_graph(self, graph):
+        if not graph_io.has_named_graphs(graph):
+            return self.upload(iter_graph_groups(graph))
+        # Named graphs (sentence provenance) hold no blank nodes, so each quad is a group of its own
+        quads = ([statement_to_nq(quad)] for quad in graph_io.iter_statements(graph) if len(quad) == 4)
+        return self.upload(chain(iter_graph_groups(graph.default_context), quads))
+
+    def upload_file(self, graph_file):
+        """Upload a graph file; N-Triples/N-Quads files are streamed, other formats are loaded first"""
+        if graph_io.detect_format(graph_file) in ("nt", "nt.gz", "nquads"):
+            return self.upload(iter_file_groups(graph_file))
+        return self.upload_graph(graph_io.load_graph(graph_file))
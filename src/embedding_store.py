@@ -0,0 +1,228 @@
+import os
+import re
+import json
+import atexit
+import hashlib
+from contextlib import contextmanager
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process use only
+    fcntl = None
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class EmbeddingStore:
+    """Persistent embedding cache for one sentence transformer model.
+
+    Vectors live in a memory-mapped float32 .npy file and are looked up by the hash of
+    their text through index.json, so a warm start only encodes strings it has never
+    seen. When more than max_entries texts are stored, the least recently used ones
+    are evicted and the vector file is compacted.
+
+    New entries are appended to a small journal (index.log) next to index.json; the full
+    index is only rewritten once save_every entries have been journaled, on compaction
+    and on flush().
+    """
+
+    def __init__(self, model_name, store_dir=None, max_entries=500000, save_every=1000):
+        if store_dir is None:
+            store_dir = os.path.join(base_dir, "data/embeddings", re.sub(r'\W+', '_', model_name))
+        os.makedirs(store_dir, exist_ok=True)
+
+        self.model_name = model_name
+        self.store_dir = store_dir
+        self.max_entries = max_entries
+        self.save_every = save_every
+        self.index_path = os.path.join(store_dir, "index.json")
+        self.log_path = os.path.join(store_dir, "index.log")
+        self.vectors_path = os.path.join(store_dir, "vectors.npy")
+        self.lock_path = os.path.join(store_dir, ".lock")
+
+        self.entries = {}  # text hash -> [row, last used]
+        self.size = 0      # rows in use
+        self.clock = 0
+        self.clock_dirty = False  # usage times changed since the index was last written
+        self.dim = None
+        self.vectors = None
+        self.journaled = 0        # entries in index.log
+        self.disk_state = None    # (index.json mtime, index.log size) when last read or written
+        self._load()
+        atexit.register(self.flush)
+
+    @staticmethod
+    def text_key(text):
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def _disk_state(self):
+        index_mtime = os.stat(self.index_path).st_mtime_ns if os.path.exists(self.index_path) else None
+        log_size = os.path.getsize(self.log_path) if os.path.exists(self.log_path) else 0
+        return index_mtime, log_size
+
+    def _load(self):
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, 'r') as f:
+            index = json.load(f)
+        if index["model"] != self.model_name:
+            raise ValueError(f"{self.store_dir} holds embeddings of {index['model']}, not {self.model_name}")
+
+        self.entries = index["entries"]
+        self.size = index["size"]
+        self.clock = index["clock"]
+        self.dim = index["dim"]
+        self.journaled = 0
+        if os.path.exists(self.log_path):
+            with open(self.log_path, 'r') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:  # a record cut short by a crash
+                        break
+                    self.entries.update(record["entries"])
+                    self.size = max(self.size, record["size"])
+                    self.journaled += len(record["entries"])
+        self.vectors = np.load(self.vectors_path, mmap_mode="r+")
+        self.disk_state = self._disk_state()
+
+    @contextmanager
+    def _locked(self):
+        """Serialize writers sharing the store and pick up what other processes added"""
+        with open(self.lock_path, 'w') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                if self._disk_state() != self.disk_state:
+                    self._load()
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _save_index(self):
+        """Rewrite index.json with every entry and empty the journal (lock held)"""
+        index = {
+            "model": self.model_name,
+            "dim": self.dim,
+            "size": self.size,
+            "clock": self.clock,
+            "entries": self.entries
+        }
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f)
+        # Drop the journal first: if we stop in between, journaled entries are only re-encoded
+        if os.path.exists(self.log_path):
+            os.remove(self.log_path)
+        os.replace(tmp_path, self.index_path)
+        self.journaled = 0
+        self.disk_state = self._disk_state()
+        self.clock_dirty = False
+
+    def _ensure_capacity(self, rows):
+        capacity = 0 if self.vectors is None else self.vectors.shape[0]
+        if rows <= capacity:
+            return
+        new_capacity = max(rows, 2 * capacity, 1024)
+        tmp_path = self.vectors_path + ".tmp.npy"
+        grown = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float32, shape=(new_capacity, self.dim))
+        if self.size:
+            grown[:self.size] = self.vectors[:self.size]
+        grown.flush()
+        del grown
+        os.replace(tmp_path, self.vectors_path)
+        self.vectors = np.load(self.vectors_path, mmap_mode="r+")
+
+    def _append(self, keys, embeddings):
+        """Store new vectors and journal their entries (lock held)"""
+        new = [(key, vector) for key, vector in zip(keys, embeddings) if key not in self.entries]
+        if not new:
+            return
+        if self.dim is None:
+            self.dim = int(embeddings.shape[1])
+        self._ensure_capacity(self.size + len(new))
+        added = {}
+        for key, vector in new:
+            self.vectors[self.size] = vector
+            self.entries[key] = added[key] = [self.size, self.clock]
+            self.size += 1
+        self.vectors.flush()
+        if not os.path.exists(self.index_path) or self.journaled + len(added) >= self.save_every:
+            self._save_index()
+            return
+        with open(self.log_path, 'a') as f:
+            f.write(json.dumps({"entries": added, "size": self.size}) + "\n")
+        self.journaled += len(added)
+        self.disk_state = self._disk_state()
+
+    def _rows(self, keys):
+        self.clock += 1
+        for key in keys:
+            self.entries[key][1] = self.clock
+        self.clock_dirty = self.clock_dirty or bool(keys)
+        if not keys:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        return np.array(self.vectors[[self.entries[key][0] for key in keys]])
+
+    def encode(self, model, texts, batch_size=64):
+        """Embeddings for texts as a float32 array, encoding only the texts not stored yet"""
+        keys = [self.text_key(text) for text in texts]
+        if all(key in self.entries for key in keys):
+            result = self._rows(keys)
+        else:
+            # Encode outside the lock, then store under it. Taking the lock reloads the index
+            # if another process changed it, and a compaction there may have evicted texts we
+            # had, so whatever is still missing is encoded while the lock is held.
+            missing = {key: text for key, text in zip(keys, texts) if key not in self.entries}
+            embeddings = model.encode(list(missing.values()), batch_size=batch_size, convert_to_numpy=True)
+            with self._locked():
+                self._append(list(missing), np.asarray(embeddings, dtype=np.float32))
+                evicted = {key: text for key, text in zip(keys, texts) if key not in self.entries}
+                if evicted:
+                    embeddings = model.encode(list(evicted.values()), batch_size=batch_size, convert_to_numpy=True)
+                    self._append(list(evicted), np.asarray(embeddings, dtype=np.float32))
+                result = self._rows(keys)
+
+        if len(self.entries) > self.max_entries:
+            self.compact()
+        return result
+
+    def compact(self, keep=None):
+        """Rewrite the vector file with only the most recently used entries"""
+        if keep is None:
+            # Leave some headroom so the next few additions do not compact again
+            keep = int(self.max_entries * 0.8)
+        with self._locked():
+            survivors = sorted(self.entries.items(), key=lambda item: item[1][1], reverse=True)[:keep]
+            tmp_path = self.vectors_path + ".tmp.npy"
+            compacted = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float32,
+                                                  shape=(max(len(survivors), 1), self.dim))
+            entries = {}
+            for row, (key, (old_row, last_used)) in enumerate(survivors):
+                compacted[row] = self.vectors[old_row]
+                entries[key] = [row, last_used]
+            compacted.flush()
+            del compacted
+            os.replace(tmp_path, self.vectors_path)
+
+            self.entries = entries
+            self.size = len(entries)
+            self.vectors = np.load(self.vectors_path, mmap_mode="r+")
+            self._save_index()
+        print(f"Compacted embedding store {self.store_dir} to {self.size} entries")
+
+    def flush(self):
+        """Persist the usage clock so eviction order survives restarts (also run at exit)"""
+        if not self.clock_dirty:
+            return
+        # Taking the lock may reload entries another process saved; keep our newer usage times
+        last_used = {key: entry[1] for key, entry in self.entries.items()}
+        clock = self.clock
+        with self._locked():
+            for key, used in last_used.items():
+                entry = self.entries.get(key)
+                if entry is not None and used > entry[1]:
+                    entry[1] = used
+            self.clock = max(self.clock, clock)
+            self._save_index()
@@ -0,0 +1,90 @@
+import os
+import json
+import atexit
+import threading
+from collections import OrderedDict
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class EntityCache:
+    """Entities seen in query results, keyed on lowercase label: {"uri", "type", "label"}.
+
+    The JSON file is read on first use, the cache holds at most max_entries (least recently
+    used entries are evicted first), and changes are written atomically once flush_every
+    of them have accumulated, on flush(), and at interpreter exit.
+    """
+
+    def __init__(self, cache_file=None, max_entries=100000, flush_every=100):
+        if cache_file is None:
+            cache_file = os.path.join(base_dir, "data/entity_cache.json")
+        self.cache_file = cache_file
+        self.max_entries = max_entries
+        self.flush_every = flush_every
+        self.pending = 0
+        self.lock = threading.Lock()
+        self._entries = None
+        atexit.register(self.flush)
+
+    @property
+    def entries(self):
+        if self._entries is None:
+            self._entries = OrderedDict()
+            if os.path.exists(self.cache_file):
+                with open(self.cache_file, 'r') as f:
+                    self._entries.update(json.load(f))
+            self._evict()
+        return self._entries
+
+    @staticmethod
+    def key(label):
+        return " ".join(label.lower().split())
+
+    def get(self, label):
+        with self.lock:
+            entry = self.entries.get(self.key(label))
+            if entry is not None:
+                self.entries.move_to_end(self.key(label))
+            return entry
+
+    def add(self, label, uri, entity_type=""):
+        """Record an entity; returns True if it was not cached before"""
+        key = self.key(label)
+        if not key:
+            return False
+        with self.lock:
+            entry = {"uri": uri, "type": entity_type, "label": label}
+            new = self.entries.get(key) != entry
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            if new:
+                self._evict()
+                self.pending += 1
+        if self.pending >= self.flush_every:
+            self.flush()
+        return new
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def flush(self):
+        """Write pending changes to the cache file (write to a temp file, then rename)"""
+        with self.lock:
+            if not self.pending or self._entries is None:
+                return
+            os.makedirs(os.path.dirname(self.cache_file) or ".", exist_ok=True)
+            tmp_path = f"{self.cache_file}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self._entries, f, indent=2)
+            os.replace(tmp_path, self.cache_file)
+            self.pending = 0
+
+    def items(self):
+        with self.lock:
+            return list(self.entries.items())
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, label):
+        return self.key(label) in self.entries
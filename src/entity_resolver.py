@@ -0,0 +1,156 @@
+import re
+import zlib
+from collections import defaultdict, Counter
+import numpy as np
+
+# Mersenne prime used by the MinHash permutations; a * x stays below 2^62 so uint64 never overflows
+_PRIME = (1 << 31) - 1
+
+class EntityResolver:
+    """Cluster spelling variants of the same entity ("Dharamshala", "Dharmshala", "dharamshala").
+
+    Entity texts are turned into character shingles and MinHash signatures; LSH banding
+    only compares entities of the same type that share a band bucket, so the work stays
+    near-linear in the number of entities. Candidate pairs are confirmed on the exact
+    shingle Jaccard score, must have the same number of words (so "Dalhousie Hotel" stays
+    apart from "Dalhousie") and, when an embedding model is given, must also have similar
+    embeddings.
+    """
+
+    def __init__(self, threshold=0.6, shingle_size=3, num_perm=128, bands=32,
+                 embedding_model=None, embedding_threshold=0.8, seed=42):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.embedding_model = embedding_model
+        self.embedding_threshold = embedding_threshold
+
+        rng = np.random.default_rng(seed)
+        self.perm_a = rng.integers(1, _PRIME, size=num_perm, dtype=np.uint64)
+        self.perm_b = rng.integers(0, _PRIME, size=num_perm, dtype=np.uint64)
+
+    @staticmethod
+    def normalize(text):
+        return " ".join(re.sub(r'[^\w\s]', ' ', text.lower()).split())
+
+    def shingles(self, text):
+        padded = f" {self.normalize(text)} "
+        if len(padded) <= self.shingle_size:
+            return {padded}
+        return {padded[i:i + self.shingle_size] for i in range(len(padded) - self.shingle_size + 1)}
+
+    def signature(self, shingles):
+        hashes = np.array([zlib.crc32(shingle.encode("utf-8")) % _PRIME for shingle in shingles], dtype=np.uint64)
+        # (a * x + b) mod p for every permutation and shingle, minimum per permutation
+        values = (np.outer(self.perm_a, hashes) + self.perm_b[:, None]) % np.uint64(_PRIME)
+        return values.min(axis=1)
+
+    def candidate_pairs(self, signatures, types=None):
+        """Pairs of entity indices of the same type that share at least one LSH band bucket"""
+        if types is None:
+            types = [None] * len(signatures)
+        pairs = set()
+        for band in range(self.bands):
+            buckets = defaultdict(list)
+            start = band * self.rows
+            for index, signature in enumerate(signatures):
+                buckets[types[index], signature[start:start + self.rows].tobytes()].append(index)
+            for members in buckets.values():
+                for i, first in enumerate(members):
+                    for second in members[i + 1:]:
+                        pairs.add((first, second))
+        return pairs
+
+    def cluster(self, texts, types=None):
+        """Return a cluster id for every text; texts of different types are never merged"""
+        shingle_sets = [self.shingles(text) for text in texts]
+        signatures = [self.signature(shingles) for shingles in shingle_sets]
+        word_counts = [len(self.normalize(text).split()) for text in texts]
+        pairs = self.candidate_pairs(signatures, types)
+
+        embeddings = None
+        if self.embedding_model is not None and pairs:
+            embeddings = self.embedding_model.encode(texts, convert_to_numpy=True, normalize_embeddings=True)
+
+        parent = list(range(len(texts)))
+
+        def find(index):
+            while parent[index] != index:
+                parent[index] = parent[parent[index]]
+                index = parent[index]
+            return index
+
+        for first, second in pairs:
+            union = len(shingle_sets[first] | shingle_sets[second])
+            jaccard = len(shingle_sets[first] & shingle_sets[second]) / union if union else 0.0
+            if jaccard < self.threshold or word_counts[first] != word_counts[second]:
+                continue
+            if embeddings is not None and float(embeddings[first] @ embeddings[second]) < self.embedding_threshold:
+                continue
+            root_first, root_second = find(first), find(second)
+            if root_first != root_second:
+                parent[root_second] = root_first
+
+        return [find(index) for index in range(len(texts))]
+
+    def resolve(self, knowledge):
+        """Merge variant entities into canonical ones and rewrite relations to the canonical IDs.
+
+        The canonical entity of a cluster is the one mentioned in most relations (ties go
+        to the shorter text); the other texts are kept under "aliases".
+        """
+        entity_ids = list(knowledge["entities"])
+        texts = [knowledge["entities"][entity_id]["text"] for entity_id in entity_ids]
+        types = [knowledge["entities"][entity_id]["type"] for entity_id in entity_ids]
+        clusters = self.cluster(texts, types) if entity_ids else []
+
+        # Relations reference entities by label and raw text, which can differ from the entity key
+        alias_ids = {}
+        for entity_id in entity_ids:
+            entity = knowledge["entities"][entity_id]
+            alias_ids[f"{entity['type']}_{entity['text'].replace(' ', '_')}"] = entity_id
+        mentions = Counter()
+        for relation in knowledge["relations"]:
+            for key in (relation["source"], relation["target"]):
+                mentions[alias_ids.get(key, key)] += 1
+
+        members = defaultdict(list)
+        for entity_id, cluster_id in zip(entity_ids, clusters):
+            members[cluster_id].append(entity_id)
+
+        canonical = {}
+        entities = {}
+        for group in members.values():
+            canonical_id = min(group, key=lambda entity_id: (-mentions[entity_id], len(knowledge["entities"][entity_id]["text"]), entity_id))
+            for entity_id in group:
+                canonical[entity_id] = canonical_id
+            entity = dict(knowledge["entities"][canonical_id])
+            aliases = sorted({knowledge["entities"][entity_id]["text"] for entity_id in group} - {entity["text"]})
+            if aliases:
+                entity["aliases"] = aliases
+            entities[canonical_id] = entity
+
+        relations = []
+        seen = set()
+        for relation in knowledge["relations"]:
+            source = canonical.get(alias_ids.get(relation["source"], relation["source"]), relation["source"])
+            target = canonical.get(alias_ids.get(relation["target"], relation["target"]), relation["target"])
+            if source == target and relation["source"] != relation["target"]:
+                # Both ends collapsed into the same entity
+                continue
+            rewritten = dict(relation, source=source, target=target)
+            key = (source, target, rewritten["type"], rewritten.get("sentence"))
+            if key in seen:
+                continue
+            seen.add(key)
+            relations.append(rewritten)
+
+        print(f"Resolved {len(entity_ids)} entities into {len(entities)} canonical entities")
+        return {
+            "entities": entities,
+            "relations": relations
+        }
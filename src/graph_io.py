@@ -0,0 +1,236 @@
+import os
+import sys
+import gzip
+import struct
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from rdflib import Graph, Dataset, URIRef, BNode, Literal
+from nt_utils import triple_to_nt, statement_to_nq, parse_nt_line, parse_nq_line
+from sqlite_store import SQLiteStore, open_graph
+
+# File extension -> format; the longest matching suffix wins
+FORMATS = {
+    ".ttl": "turtle",
+    ".turtle": "turtle",
+    ".nt": "nt",
+    ".nt.gz": "nt.gz",
+    ".nq": "nquads",
+    ".kgb": "binary",
+    ".sqlite": "sqlite"
+}
+
+_BINARY_MAGIC = b"KGB1"
+_URI, _BNODE, _PLAIN, _LANG, _TYPED = range(5)
+
+# Files smaller than this are parsed in a single process
+_PARALLEL_MIN_BYTES = 16 * 1024 * 1024
+
+def detect_format(path):
+    """Graph serialization format from the file extension"""
+    lower = path.lower()
+    for suffix in sorted(FORMATS, key=len, reverse=True):
+        if lower.endswith(suffix):
+            return FORMATS[suffix]
+    raise ValueError(f"Cannot tell the graph format of {path}; use one of {sorted(FORMATS)}")
+
+def has_named_graphs(graph):
+    return isinstance(graph, Dataset) and any(
+        context.identifier != graph.default_context.identifier and len(context) for context in graph.contexts())
+
+def add_statements(graph, statements):
+    """Add triples and (s, p, o, graph name) quads to graph. Quads need a Dataset; a plain
+    Graph only takes the triples."""
+    default = graph.default_context if isinstance(graph, Dataset) else graph
+    graph.addN(
+        (*statement, default) if len(statement) == 3 else (*statement[:3], graph.graph(statement[3]))
+        for statement in statements
+        if len(statement) == 3 or isinstance(graph, Dataset)
+    )
+
+def iter_statements(graph):
+    """Triples of graph's default graph, then (s, p, o, graph name) quads of any named graphs"""
+    if not isinstance(graph, Dataset):
+        yield from graph
+        return
+    yield from graph.default_context
+    for context in graph.contexts():
+        if context.identifier != graph.default_context.identifier:
+            for triple in context:
+                yield (*triple, context.identifier)
+
+def iter_nquads(graph):
+    """N-Quads lines of graph; the default graph's lines are plain N-Triples"""
+    return map(statement_to_nq, iter_statements(graph))
+
+def save_graph(graph, path):
+    """Serialize graph to path in the format given by its extension"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    graph_format = detect_format(path)
+    if graph_format != "nquads" and has_named_graphs(graph):
+        raise ValueError(f"The graph has named graphs (sentence provenance), which {path} cannot hold; save it as .nq")
+    if isinstance(graph, Dataset) and graph_format != "nquads":
+        graph = graph.default_context
+    if graph_format == "nquads":
+        with open(path, 'w', encoding="utf-8") as f:
+            f.writelines(iter_nquads(graph))
+    elif graph_format == "turtle":
+        graph.serialize(destination=path, format="turtle")
+    elif graph_format == "nt":
+        with open(path, 'w', encoding="utf-8") as f:
+            f.writelines(triple_to_nt(triple) for triple in graph)
+    elif graph_format == "nt.gz":
+        with gzip.open(path, 'wt', encoding="utf-8", compresslevel=6) as f:
+            f.writelines(triple_to_nt(triple) for triple in graph)
+    elif graph_format == "sqlite":
+        # Replace what is there, as the other formats overwrite their file
+        store = SQLiteStore(path)
+        store.clear()
+        for prefix, namespace in graph.namespaces():
+            store.bind(prefix, namespace)
+        store.bulk_load(graph)
+        store.close()
+    else:
+        _save_binary(graph, path)
+
+def new_graph(path):
+    """Empty in-memory graph for a file of path's format: a Dataset for .nq, else a Graph"""
+    return Dataset() if detect_format(path) == "nquads" else Graph()
+
+def load_graph(path, graph=None, workers=None):
+    """Load path into graph (a new in-memory Graph by default, a Dataset for .nq), detecting the format.
+
+    Plain N-Triples files are split at line boundaries and parsed by `workers`
+    processes (all CPUs by default) when they are large enough to benefit. A .sqlite
+    store is not parsed at all: without a target graph it is opened read-only in place.
+    """
+    graph_format = detect_format(path)
+    if graph_format == "sqlite":
+        if graph is None:
+            return open_graph(path, read_only=True)
+        graph.addN((*triple, graph) for triple in open_graph(path, read_only=True))
+        return graph
+    if graph is None:
+        graph = new_graph(path)
+    if graph_format == "nquads":
+        with open(path, 'r', encoding="utf-8") as f:
+            add_statements(graph, filter(None, map(parse_nq_line, f)))
+    elif graph_format == "turtle":
+        graph.parse(path, format="turtle")
+    elif graph_format == "nt":
+        _load_ntriples(path, graph, workers)
+    elif graph_format == "nt.gz":
+        with gzip.open(path, 'rt', encoding="utf-8") as f:
+            graph.addN((*triple, graph) for triple in map(parse_nt_line, f) if triple is not None)
+    else:
+        _load_binary(path, graph)
+    return graph
+
+def _chunk_offsets(path, chunks):
+    """Byte ranges of roughly equal size that start and end on line boundaries"""
+    size = os.path.getsize(path)
+    offsets = [0]
+    with open(path, 'rb') as f:
+        for i in range(1, chunks):
+            f.seek(size * i // chunks)
+            f.readline()
+            position = f.tell()
+            if position > offsets[-1] and position < size:
+                offsets.append(position)
+    offsets.append(size)
+    return list(zip(offsets[:-1], offsets[1:]))
+
+def _parse_chunk(args):
+    path, start, end = args
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start).decode("utf-8")
+    return [triple for triple in map(parse_nt_line, data.splitlines()) if triple is not None]
+
+def _load_ntriples(path, graph, workers=None):
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or os.path.getsize(path) < _PARALLEL_MIN_BYTES:
+        with open(path, 'r', encoding="utf-8") as f:
+            graph.addN((*triple, graph) for triple in map(parse_nt_line, f) if triple is not None)
+        return
+
+    ranges = [(path, start, end) for start, end in _chunk_offsets(path, workers * 4)]
+    with ProcessPoolExecutor(workers) as pool:
+        for triples in pool.map(_parse_chunk, ranges):
+            graph.addN((*triple, graph) for triple in triples)
+
+def _write_string(f, value):
+    data = value.encode("utf-8")
+    f.write(struct.pack("<I", len(data)))
+    f.write(data)
+
+def _read_string(f):
+    (length,) = struct.unpack("<I", f.read(4))
+    return f.read(length).decode("utf-8")
+
+def _save_binary(graph, path):
+    """Gzip-compressed, dictionary-encoded graph: a table of distinct terms, then triples as term ids"""
+    term_ids = {}
+    ids = array("I")
+    for triple in graph:
+        for term in triple:
+            term_id = term_ids.get(term)
+            if term_id is None:
+                term_id = term_ids[term] = len(term_ids)
+            ids.append(term_id)
+
+    with gzip.open(path, 'wb', compresslevel=6) as f:
+        f.write(_BINARY_MAGIC)
+        f.write(struct.pack("<I", len(term_ids)))
+        for term in term_ids:
+            if isinstance(term, URIRef):
+                f.write(bytes([_URI]))
+                _write_string(f, str(term))
+            elif isinstance(term, BNode):
+                f.write(bytes([_BNODE]))
+                _write_string(f, str(term))
+            elif term.language:
+                f.write(bytes([_LANG]))
+                _write_string(f, str(term))
+                _write_string(f, term.language)
+            elif term.datatype:
+                f.write(bytes([_TYPED]))
+                _write_string(f, str(term))
+                _write_string(f, str(term.datatype))
+            else:
+                f.write(bytes([_PLAIN]))
+                _write_string(f, str(term))
+        if sys.byteorder == "big":
+            ids.byteswap()
+        f.write(struct.pack("<I", len(ids) // 3))
+        f.write(ids.tobytes())
+
+def _load_binary(path, graph):
+    with gzip.open(path, 'rb') as f:
+        if f.read(4) != _BINARY_MAGIC:
+            raise ValueError(f"{path} is not a binary knowledge graph file")
+        (term_count,) = struct.unpack("<I", f.read(4))
+        terms = []
+        for _ in range(term_count):
+            kind = f.read(1)[0]
+            value = _read_string(f)
+            if kind == _URI:
+                terms.append(URIRef(value))
+            elif kind == _BNODE:
+                terms.append(BNode(value))
+            elif kind == _LANG:
+                terms.append(Literal(value, lang=_read_string(f)))
+            elif kind == _TYPED:
+                terms.append(Literal(value, datatype=URIRef(_read_string(f))))
+            else:
+                terms.append(Literal(value))
+
+        (triple_count,) = struct.unpack("<I", f.read(4))
+        ids = array("I")
+        ids.frombytes(f.read(triple_count * 3 * 4))
+        if sys.byteorder == "big":
+            ids.byteswap()
+
+    graph.addN(
+        (terms[ids[i]], terms[ids[i + 1]], terms[ids[i + 2]], graph)
+        for i in range(0, len(ids), 3)
+    )
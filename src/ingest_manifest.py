@@ -0,0 +1,56 @@
+import os
+import json
+import hashlib
+
+class IngestManifest:
+    """Tracks which PDFs have been extracted, from which content and with which pipeline versions"""
+
+    def __init__(self, manifest_path):
+        self.manifest_path = manifest_path
+        self.entries = {}
+
+        if os.path.exists(manifest_path):
+            with open(manifest_path, 'r') as f:
+                self.entries = json.load(f).get("files", {})
+
+    @staticmethod
+    def file_hash(path, chunk_size=1 << 20):
+        """SHA-256 of a file's content, read in chunks"""
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def is_current(self, filename, content_hash, versions):
+        """True if the file was extracted from the same content with the same models and ontology"""
+        entry = self.entries.get(filename)
+        if entry is None:
+            return False
+        if entry["content_hash"] != content_hash:
+            return False
+        if entry["model_version"] != versions["model_version"] or entry["ontology_version"] != versions["ontology_version"]:
+            return False
+        # A PDF without text has no output to reuse
+        return entry["output_path"] is None or os.path.exists(entry["output_path"])
+
+    def record(self, filename, content_hash, versions, output_path):
+        self.entries[filename] = {
+            "content_hash": content_hash,
+            "model_version": versions["model_version"],
+            "ontology_version": versions["ontology_version"],
+            "output_path": output_path
+        }
+
+    def remove(self, filename):
+        return self.entries.pop(filename, None)
+
+    def filenames(self):
+        return set(self.entries)
+
+    def save(self):
+        """Write the manifest atomically so an interrupted run never leaves a truncated file"""
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({"files": self.entries}, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
@@ -0,0 +1,162 @@
+import os
+import re
+import sys
+import json
+import time
+import logging
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger("kg_pipeline")
+
+def configure_logging(level="INFO"):
+    """Set the verbosity of pipeline logging (DEBUG also prints every parsed sentence)"""
+    logging.basicConfig(format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    logger.setLevel(getattr(logging, str(level).upper()))
+
+def process_peak_rss_mb():
+    """Peak resident memory of this process since it started (never goes down)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+_HWM_RE = re.compile(r"^VmHWM:\s+(\d+) kB", re.MULTILINE)
+
+def reset_peak_rss():
+    """Restart the peak resident memory count (Linux 4.0+); False where that is not possible"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+def peak_rss_mb():
+    """Peak resident memory since the last reset_peak_rss(); None where /proc is not available"""
+    try:
+        with open("/proc/self/status") as f:
+            match = _HWM_RE.search(f.read())
+    except OSError:
+        return None
+    return round(int(match.group(1)) / 1024, 1) if match else None
+
+class PipelineProfiler:
+    """Records wall time, CPU time, peak memory and throughput of pipeline stages.
+
+    Use `with profiler.stage("ner", items=n) as record:` around a stage; `record["items"]`
+    can also be set inside the block once the count is known. Records are tagged with the
+    PDF in `profiler.pdf`.
+
+    peak_rss_mb is the peak resident memory within the stage. Where the kernel cannot reset
+    that peak, process_peak_rss_mb (the peak of the whole process so far, the same for every
+    stage after the heaviest one) is recorded instead. With trace_memory=True the Python
+    allocation peak of each stage is measured with tracemalloc as well, at some cost in speed.
+    """
+
+    def __init__(self, enabled=True, trace_memory=False):
+        self.enabled = enabled
+        self.trace_memory = trace_memory
+        self.records = []
+        self.pdf = None
+        self.started = time.time()
+        # [peak RSS, peak traced] seen so far by each open stage, innermost last; resetting
+        # the peaks for a nested stage would otherwise lose the outer stage's
+        self.open_peaks = []
+
+        if enabled and trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name, items=0, pdf=None):
+        record = {"stage": name, "pdf": pdf or self.pdf, "items": items}
+        if not self.enabled:
+            yield record
+            return
+
+        if self.open_peaks:
+            self._fold_peaks(self.open_peaks[-1], self._current_peaks())
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        self.open_peaks.append([0.0 if reset_peak_rss() else None, 0])
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield record
+        finally:
+            wall = time.perf_counter() - wall_start
+            record["wall_seconds"] = round(wall, 4)
+            record["cpu_seconds"] = round(time.process_time() - cpu_start, 4)
+            peaks = self.open_peaks.pop()
+            self._fold_peaks(peaks, self._current_peaks())
+            if self.open_peaks:
+                self._fold_peaks(self.open_peaks[-1], peaks)
+            if peaks[0] is not None:
+                record["peak_rss_mb"] = peaks[0]
+            else:
+                record["process_peak_rss_mb"] = process_peak_rss_mb()
+            if self.trace_memory:
+                record["peak_traced_mb"] = round(peaks[1] / (1024 * 1024), 1)
+            record["items_per_second"] = round(record["items"] / wall, 1) if wall > 0 else None
+            self.records.append(record)
+            logger.info("%s%s: %d items in %.2fs (%s items/s)", name,
+                        f" [{record['pdf']}]" if record["pdf"] else "", record["items"],
+                        wall, record["items_per_second"])
+
+    def _current_peaks(self):
+        return [peak_rss_mb() or 0.0, tracemalloc.get_traced_memory()[1] if self.trace_memory else 0]
+
+    @staticmethod
+    def _fold_peaks(peaks, other):
+        if peaks[0] is not None:
+            peaks[0] = max(peaks[0], other[0] or 0.0)
+        peaks[1] = max(peaks[1], other[1])
+
+    def drain(self):
+        """Hand over the records collected so far (used to ship worker records to the parent)"""
+        records, self.records = self.records, []
+        return records
+
+    def extend(self, records):
+        if self.enabled:
+            self.records.extend(records)
+
+    def summary(self):
+        """Totals per stage across all PDFs"""
+        totals = defaultdict(lambda: {"calls": 0, "items": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0,
+                                      "peak_rss_mb": None})
+        for record in self.records:
+            total = totals[record["stage"]]
+            total["calls"] += 1
+            total["items"] += record["items"]
+            total["wall_seconds"] += record["wall_seconds"]
+            total["cpu_seconds"] += record["cpu_seconds"]
+            for field in ("peak_rss_mb", "process_peak_rss_mb", "peak_traced_mb"):
+                if record.get(field) is not None:
+                    total[field] = max(total.get(field) or 0.0, record[field])
+        for total in totals.values():
+            total["wall_seconds"] = round(total["wall_seconds"], 4)
+            total["cpu_seconds"] = round(total["cpu_seconds"], 4)
+            total["items_per_second"] = round(total["items"] / total["wall_seconds"], 1) if total["wall_seconds"] > 0 else None
+        return dict(totals)
+
+    def write_report(self, output_path):
+        """Write the per-stage summary and every per-PDF record as a JSON run report"""
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        report = {
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+            "total_seconds": round(time.time() - self.started, 3),
+            "stages": self.summary(),
+            "records": self.records
+        }
+        with open(output_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Run report saved to {output_path}")
+        return report
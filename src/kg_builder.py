@@ -1,13 +1,39 @@
 import os
 import json
-from rdflib import Graph, Literal, RDF, URIRef, Namespace, BNode
-from rdflib.namespace import FOAF, XSD, RDFS
+import hashlib
+from rdflib import Graph, Dataset, Literal, RDF, URIRef, Namespace, BNode
+from rdflib.namespace import FOAF, XSD, RDFS, SKOS
+from instrumentation import PipelineProfiler
+from nt_utils import statement_to_nq, quad_to_nq
+from bloom_filter import BloomFilter
+import graph_io
+from sqlite_store import open_graph
 
 base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
+# How the source sentence of a relation is recorded:
+#   reification - an rdf:Statement blank node per relation with its own copy of the sentence
+#   sentence    - each distinct sentence stored once under ex:sentence/<hash> (its text as
+#                 rdfs:comment), and each relation also put in the named graph of every
+#                 sentence supporting it: one (s, p, o, sentence) quad per fact and source.
+#                 The graph is a Dataset and has to be written as N-Quads (.nq)
+#   none        - no provenance
+PROVENANCE_MODES = ("reification", "sentence", "none")
+
 class KnowledgeGraphBuilder:
-    def __init__(self):
-        self.g = Graph()
+    def __init__(self, profiler=None, provenance="reification", store=None):
+        if provenance not in PROVENANCE_MODES:
+            raise ValueError(f"Unknown provenance mode '{provenance}', expected one of {PROVENANCE_MODES}")
+        # store: path of a SQLite database to build the graph on disk instead of in memory;
+        # like a new in-memory graph it starts out empty
+        if store and provenance == "sentence":
+            raise ValueError("Sentence provenance uses named graphs, which the SQLite store cannot hold")
+        if store:
+            self.g = open_graph(store, clear=True)
+        else:
+            self.g = Dataset() if provenance == "sentence" else Graph()
+        self.profiler = profiler or PipelineProfiler(enabled=False)
+        self.provenance = provenance
         
         # Define namespaces
         self.ex = Namespace("http://example.org/")
@@ -16,8 +42,19 @@ class KnowledgeGraphBuilder:
         # Bind namespaces
         self.g.bind("ex", self.ex)
         self.g.bind("schema", self.schema)
+
+        self.reset_state()
         
     
+    def reset_state(self):
+        """Forget the entities and provenance emitted so far, so the next output is complete on its own"""
+        # entity id -> URI of every entity seen so far
+        self.entity_uris = {}
+
+        # Sentences and (fact, sentence) quads already emitted in "sentence" provenance mode
+        self.seen_sentences = set()
+        self.seen_sources = set()
+
     def create_uri_for_entity(self, entity_id, entity_type):
         """Create a URI for an entity based on its ID and type"""
         # Clean the entity ID to ensure valid URI
@@ -35,77 +72,205 @@ class KnowledgeGraphBuilder:
         # else:
         #     return self.ex["concept/" + clean_id]
     
-    def build_from_extracted_data(self, knowledge_data=None):
-        """Build knowledge graph from extracted data"""
-        if knowledge_data is None:
-            knowledge_data = os.path.join(base_dir, "data/extracted/combined_knowledge.json")
-        if isinstance(knowledge_data, str):
-            # If input is a file path
-            with open(knowledge_data, 'r') as f:
-                knowledge_data = json.load(f)
+    def relation_triples(self, relation):
+        """Triples for one relation whose source and target are both known, plus an
+        (s, p, o, sentence) quad in "sentence" provenance mode"""
+        source_uri = self.entity_uris[relation["source"]]
+        target_uri = self.entity_uris[relation["target"]]
         
+        # Create URI for relation
+        relation_uri = self.ex[relation["type"]]
+        
+        # Add relation to graph
+        triples = [(source_uri, relation_uri, target_uri)]
+        
+        # Add provenance (sentence)
+        if "sentence" not in relation or self.provenance == "none":
+            return triples
+
+        if self.provenance == "sentence":
+            sentence_uri = self.sentence_uri(relation["sentence"])
+            if sentence_uri not in self.seen_sentences:
+                self.seen_sentences.add(sentence_uri)
+                triples.append((sentence_uri, RDFS.comment, Literal(relation["sentence"])))
+            quad = (source_uri, relation_uri, target_uri, sentence_uri)
+            if quad not in self.seen_sources:
+                self.seen_sources.add(quad)
+                triples.append(quad)
+        else:
+            stmt_node = BNode()
+            triples.append((stmt_node, RDF.type, RDF.Statement))
+            triples.append((stmt_node, RDF.subject, source_uri))
+            triples.append((stmt_node, RDF.predicate, relation_uri))
+            triples.append((stmt_node, RDF.object, target_uri))
+            triples.append((stmt_node, RDFS.comment, Literal(relation["sentence"])))
+        return triples
+
+    def sentence_uri(self, sentence):
+        """Content-addressed URI of a source sentence"""
+        return self.ex["sentence/" + hashlib.sha1(sentence.encode("utf-8")).hexdigest()[:16]]
+
+    def iter_triples(self, knowledge_data):
+        """Yield the triples for one batch of extracted knowledge.
+
+        Entities are remembered across calls, so documents can be fed one at a time
+        (reset_state() starts over; the build/write methods below do so themselves).
+        Relations whose endpoints are unknown are dropped: a document's relations only
+        refer to that document's entities, so they would not resolve later either.
+        """
         # Add entities to graph
-        entity_uris = {}
         for entity_id, entity_info in knowledge_data["entities"].items():
+            if entity_id in self.entity_uris:
+                continue
             entity_type = entity_info["type"]
             entity_text = entity_info["text"]
             
             # Create URI for entity
             entity_uri = self.create_uri_for_entity(entity_id, entity_type)
-            entity_uris[entity_id] = entity_uri
+            self.entity_uris[entity_id] = entity_uri
             
             # Add entity to graph
-            self.g.add((entity_uri, RDF.type, self.ex[entity_type]))
-            self.g.add((entity_uri, RDFS.label, Literal(entity_text)))
+            yield (entity_uri, RDF.type, self.ex[entity_type])
+            yield (entity_uri, RDFS.label, Literal(entity_text))
+            # Variants merged in by entity resolution
+            for alias in entity_info.get("aliases", []):
+                yield (entity_uri, SKOS.altLabel, Literal(alias))
         # print(entity_uris)
         # Add relations to graph
         for relation in knowledge_data["relations"]:
-            source_id = relation["source"]
-            target_id = relation["target"]
-            relation_type = relation["type"]
-            
-            if source_id in entity_uris and target_id in entity_uris:
-                source_uri = entity_uris[source_id]
-                target_uri = entity_uris[target_id]
-                
-                # Create URI for relation
-                relation_uri = self.ex[relation_type]
-                
-                # Add relation to graph
-                self.g.add((source_uri, relation_uri, target_uri))
-                
-                # Add provenance (sentence)
-                if "sentence" in relation:
-                    stmt_node = BNode()
-                    self.g.add((stmt_node, RDF.type, RDF.Statement))
-                    self.g.add((stmt_node, RDF.subject, source_uri))
-                    self.g.add((stmt_node, RDF.predicate, relation_uri))
-                    self.g.add((stmt_node, RDF.object, target_uri))
-                    self.g.add((stmt_node, RDFS.comment, Literal(relation["sentence"])))
+            if relation["source"] in self.entity_uris and relation["target"] in self.entity_uris:
+                yield from self.relation_triples(relation)
+
+    def iter_document_triples(self, knowledge_stream):
+        """Turn a stream of per-document knowledge into per-document lists of triples.
+
+        A relation's provenance blank node always stays in the same list as its other triples.
+        Entities are remembered from one document to the next, but not from earlier calls.
+        """
+        self.reset_state()
+        for knowledge in knowledge_stream:
+            with self.profiler.stage("graph_build") as record:
+                triples = list(self.iter_triples(knowledge))
+                record["items"] = len(triples)
+            yield triples
+
+    def build_from_extracted_data(self, knowledge_data=None):
+        """Build knowledge graph from extracted data"""
+        if knowledge_data is None:
+            knowledge_data = os.path.join(base_dir, "data/extracted/combined_knowledge.json")
+        if isinstance(knowledge_data, str):
+            # If input is a file path
+            with open(knowledge_data, 'r') as f:
+                knowledge_data = json.load(f)
+        
+        self.reset_state()
+        graph_io.add_statements(self.g, self.iter_triples(knowledge_data))
                     
         # print("Graph is like :->>>>>>>",self.g)
         print(f"Created knowledge graph with {len(self.g)} triples")
         return self.g
     
+    def write_ntriples(self, knowledge_data=None, destination=None, graph_name=None, dedup="exact",
+                       bloom_capacity=10_000_000, bloom_error_rate=0.001):
+        """Stream the graph for extracted data straight to N-Triples without building a Graph.
+
+        knowledge_data is a knowledge dict, a path to one, or an iterable of per-document
+        dicts. destination is a path or any writable text stream (e.g. socket.makefile("w")).
+        With graph_name set, N-Quads lines in that named graph are written instead. In
+        "sentence" provenance mode the output holds quads and is N-Quads either way.
+        Repeated triples are dropped with an exact set of 8-byte digests (dedup="exact"),
+        a Bloom filter of bounded size (dedup="bloom", may drop a few unique triples) or
+        not at all (dedup=None). Returns the number of lines written.
+        """
+        if knowledge_data is None:
+            knowledge_data = os.path.join(base_dir, "data/extracted/combined_knowledge.json")
+        if isinstance(knowledge_data, str):
+            with open(knowledge_data, 'r') as f:
+                knowledge_data = json.load(f)
+        if destination is None:
+            extension = "nq" if self.provenance == "sentence" else "nt"
+            destination = os.path.join(base_dir, f"data/knowledge_graphs/knowledge_graph.{extension}")
+
+        if isinstance(knowledge_data, dict):
+            self.reset_state()
+            triples = self.iter_triples(knowledge_data)
+        else:
+            triples = (triple for triples in self.iter_document_triples(knowledge_data) for triple in triples)
+
+        if dedup == "bloom":
+            seen = BloomFilter(bloom_capacity, bloom_error_rate)
+        elif dedup == "exact":
+            seen = set()
+        else:
+            seen = None
+
+        if isinstance(destination, str):
+            os.makedirs(os.path.dirname(destination) or ".", exist_ok=True)
+            out = open(destination, 'w', encoding="utf-8")
+        else:
+            out = destination
+
+        written = 0
+        try:
+            for triple in triples:
+                if graph_name is None or len(triple) == 4:
+                    line = statement_to_nq(triple)
+                else:
+                    line = quad_to_nq(triple, graph_name)
+                if seen is not None:
+                    key = hashlib.blake2b(line.encode("utf-8"), digest_size=8).digest()
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                out.write(line)
+                written += 1
+        finally:
+            if out is not destination:
+                out.close()
+            else:
+                out.flush()
+
+        print(f"Wrote {written} triples to {destination}")
+        return written
+
     def save_graph(self, output_path=None):
+        """Save knowledge graph to file; the format (.ttl, .nt, .nt.gz, .nq, .kgb, .sqlite) follows the extension"""
         
         if output_path is None:
-            output_path = os.path.join(base_dir, "data/knowledge_graphs/knowledge_graph.ttl")
+            extension = "nq" if self.provenance == "sentence" else "ttl"
+            output_path = os.path.join(base_dir, f"data/knowledge_graphs/knowledge_graph.{extension}")
 
         # Create directory if it doesn't exist
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
         
         # Save graph
-        self.g.serialize(destination=output_path, format="turtle")
+        graph_io.save_graph(self.g, output_path)
         print(f"Saved knowledge graph to {output_path}")
     
-    def load_graph(self, input_path):
-        """Load knowledge graph from file"""
-        self.g = Graph()
-        self.g.parse(input_path, format="turtle")
+    def load_graph(self, input_path, workers=None):
+        """Load knowledge graph from file, detecting the format from the extension"""
+        self.g = graph_io.load_graph(input_path, workers=workers)
         print(f"Loaded knowledge graph with {len(self.g)} triples")
         return self.g
 
+def compare_provenance_modes(knowledge_data=None):
+    """Triple count and N-Triples size of the graph for extracted data under each provenance mode"""
+    if knowledge_data is None:
+        knowledge_data = os.path.join(base_dir, "data/extracted/combined_knowledge.json")
+    if isinstance(knowledge_data, str):
+        with open(knowledge_data, 'r') as f:
+            knowledge_data = json.load(f)
+
+    report = {}
+    for mode in PROVENANCE_MODES:
+        builder = KnowledgeGraphBuilder(provenance=mode)
+        lines = {statement_to_nq(triple) for triple in builder.iter_triples(knowledge_data)}
+        report[mode] = {
+            "triples": len(lines),
+            "ntriples_bytes": sum(len(line.encode("utf-8")) for line in lines)
+        }
+    return report
+
 if __name__ == "__main__":
     builder = KnowledgeGraphBuilder()
     
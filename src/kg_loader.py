@@ -3,20 +3,27 @@ from rdflib import Graph, Literal, RDF, URIRef, Namespace
 from rdflib.namespace import FOAF, XSD
 import requests
 from SPARQLWrapper import SPARQLWrapper, JSON
+from sqlite_store import open_graph
+from chunked_upload import ChunkedUploader
 
 class KnowledgeGraphLoader:
-    def __init__(self, fuseki_url="http://localhost:3030"):
+    def __init__(self, fuseki_url="http://localhost:3030", store=None):
         self.fuseki_url = fuseki_url
         self.dataset = "testkg"
         self.sparql_endpoint = f"{fuseki_url}/{self.dataset}/sparql"
         self.update_endpoint = f"{fuseki_url}/{self.dataset}/update"
-        self.g = Graph()
+        # store: path of a SQLite database to keep the graph on disk instead of in memory
+        self.store = store
+        self.g = self.new_graph()
         
         # Define namespaces
         self.ex = Namespace("http://example.org/")
         self.g.bind("ex", self.ex)
         self.g.bind("foaf", FOAF)
     
+    def new_graph(self):
+        return open_graph(self.store) if self.store else Graph()
+
     def create_sample_data(self):
         """Create some sample triples for a knowledge graph"""
         # Add people
@@ -46,13 +53,25 @@ class KnowledgeGraphLoader:
     
     def load_from_file(self, filename="/data/sample_data.ttl"):
         """Load data from a Turtle file"""
-        self.g = Graph()
-        self.g.parse(filename, format="turtle")
+        if self.store:
+            # Parse in memory and write to the open store in one transaction; parsing into the
+            # store directly would insert triple by triple
+            parsed = Graph().parse(filename, format="turtle")
+            for prefix, namespace in parsed.namespaces():
+                self.g.bind(prefix, namespace)
+            self.g.addN((*triple, self.g) for triple in parsed)
+        else:
+            self.g = self.new_graph()
+            self.g.parse(filename, format="turtle")
         print(f"Loaded {len(self.g)} triples from {filename}")
         return self.g
     
-    def upload_to_fuseki(self):
-        """Upload the graph to Fuseki server"""
+    def upload_to_fuseki(self, chunk_size=None, workers=4, compress=True, retries=3):
+        """Upload the graph to Fuseki server (in concurrent gzip-compressed chunks if chunk_size is set)"""
+        if chunk_size:
+            uploader = ChunkedUploader(f"{self.fuseki_url}/{self.dataset}/data", chunk_size, workers, compress, retries)
+            return uploader.upload_graph(self.g)["failed_chunks"] == 0
+
         data = self.g.serialize(format="turtle")
         # print(data)
         # Upload data
@@ -1,16 +1,13 @@
-from SPARQLWrapper import SPARQLWrapper, JSON
+from sparql_client import get_client
 import json
 
 class KnowledgeGraphQuerier:
     def __init__(self, endpoint_url="http://localhost:3030/testkg/sparql"):
-        self.sparql = SPARQLWrapper(endpoint_url)
-        self.sparql.setReturnFormat(JSON)
+        self.sparql = get_client(endpoint_url)
     
     def run_query(self, query):
         """Run a SPARQL query and return results"""
-        self.sparql.setQuery(query)
-        results = self.sparql.query().convert()
-        return results
+        return self.sparql.query(query)
     
     def get_all_people(self):
         """Get all people in the knowledge graph"""
@@ -1,31 +1,127 @@
 import os
 import requests
-from rdflib import Graph
-from SPARQLWrapper import SPARQLWrapper, JSON
+from sparql_client import get_client, sparql_values
+from local_backend import LocalSPARQLBackend
+from nt_utils import statement_to_nq
+from instrumentation import PipelineProfiler
+from chunked_upload import ChunkedUploader
+from query_cache import QueryCache, cache_dir, bump_version
+import graph_io
 
 base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
+ALL_ENTITIES_QUERY = """
+        PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+        SELECT DISTINCT ?entity ?label ?type
+        WHERE {
+            ?entity a ?type .
+            OPTIONAL { ?entity rdfs:label ?label }
+        }
+        """
+
+ALL_RELATIONS_QUERY = """
+        PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+        SELECT ?subject ?predicate ?object ?sLabel ?oLabel
+        WHERE {
+            ?subject ?predicate ?object .
+            
+            # Filter out RDF, RDFS and OWL properties
+            FILTER(!STRSTARTS(STR(?predicate), "http://www.w3.org/1999/02/22-rdf-syntax-ns#"))
+            FILTER(!STRSTARTS(STR(?predicate), "http://www.w3.org/2000/01/rdf-schema#"))
+            FILTER(!STRSTARTS(STR(?predicate), "http://www.w3.org/2002/07/owl#"))
+            
+            
+        }
+        """
+
+# Group patterns for batch_query; ?key is bound to each requested label in turn
+ENTITY_PATTERNS = {
+    "exact": "?entity rdfs:label ?key . BIND(?key AS ?label)",
+    "contains": "?entity rdfs:label ?label . FILTER(CONTAINS(LCASE(STR(?label)), LCASE(?key)))"
+}
+
 class KnowledgeGraphStore:
-    def __init__(self, fuseki_url="http://localhost:3030", dataset="kg"):
+    def __init__(self, fuseki_url="http://localhost:3030", dataset="kg", profiler=None, timeout=30, pool_size=10,
+                 cache_results=False, cache_options=None, backend=None, graph=None, cache_on_disk=False):
         self.fuseki_url = fuseki_url
+        self.profiler = profiler or PipelineProfiler(enabled=False)
         self.dataset = dataset
         self.sparql_endpoint = f"{fuseki_url}/{dataset}/sparql"
         self.update_endpoint = f"{fuseki_url}/{dataset}/update"
         self.data_endpoint = f"{fuseki_url}/{dataset}/data"
+
+        # "fuseki" talks to the server; "local" runs the same SPARQL in-process against graph
+        # (an rdflib Graph or a graph file, see LocalSPARQLBackend) without any server
+        self.backend = backend or os.environ.get("KG_BACKEND", "fuseki")
+        if self.backend == "local":
+            self.client = LocalSPARQLBackend(graph)
+        elif self.backend == "fuseki":
+            # Shared by every store on this endpoint, so connections are reused across queries
+            self.client = get_client(self.sparql_endpoint, timeout=timeout, pool_size=pool_size)
+        else:
+            raise ValueError(f"Unknown backend '{self.backend}', expected 'fuseki' or 'local'")
+
+        # Every upload bumps the graph version in this file, which invalidates cached results
+        # in all processes querying the dataset on this server (or local graph)
+        if self.backend == "local":
+            # An in-memory graph without a file is private to this process
+            source = f"local:{self.client.graph_path or self.client.graph.identifier}"
+        else:
+            source = f"fuseki:{fuseki_url}"
+        self.cache_dir = cache_dir(dataset, source)
+        self.version_file = os.path.join(self.cache_dir, "graph_version")
+        self.query_cache = None
+        if cache_results:
+            # Results are also kept on disk across restarts only when asked for
+            options = {"disk_dir": os.path.join(self.cache_dir, "results") if cache_on_disk else None}
+            options.update(cache_options or {})
+            self.query_cache = QueryCache(self.version_file, **options)
+
+    def graph_changed(self):
+        """Record that the dataset was modified so cached query results are no longer served"""
+        bump_version(self.version_file)
     
-    def upload_graph(self, graph=None, graph_file=None):
-        """Upload a knowledge graph to Fuseki"""
+    def upload_graph(self, graph=None, graph_file=None, chunk_size=None, workers=4, compress=True, retries=3):
+        """Upload a knowledge graph to Fuseki.
+
+        With chunk_size set the graph is sent as gzip-compressed N-Triples chunks of that many
+        triples over `workers` concurrent connections, and failed chunks are retried on their own.
+        """
 
         if graph_file is None:
             graph_file = os.path.join(base_dir, "data/knowledge_graphs/knowledge_graph.ttl")
 
         if graph is None and graph_file is None:
             raise ValueError("Either graph or graph_file must be provided")
+
+        if self.backend == "local":
+            added = self.client.add_graph(graph) if graph is not None else self.client.add_file(graph_file)
+            self.graph_changed()
+            print(f"Successfully added {added} triples to the local graph")
+            return True
+
+        if chunk_size:
+            uploader = ChunkedUploader(self.data_endpoint, chunk_size, workers, compress, retries)
+            stats = uploader.upload_graph(graph) if graph is not None else uploader.upload_file(graph_file)
+            if stats["chunks"]:
+                self.graph_changed()
+            return stats["failed_chunks"] == 0
         
+        # N-Triples/N-Quads files are already in an upload format, send them as they are
+        if graph is None and graph_io.detect_format(graph_file) in ("nt", "nt.gz", "nquads"):
+            return self.upload_ntriples_file(graph_file)
+
         # Load graph from file if provided
         if graph is None and graph_file is not None:
-            graph = Graph()
-            graph.parse(graph_file, format="turtle")
+            graph = graph_io.load_graph(graph_file)
+
+        # Turtle has no named graphs; send those (sentence provenance) as N-Quads
+        if graph_io.has_named_graphs(graph):
+            if not self.post_ntriples(list(graph_io.iter_nquads(graph))):
+                return False
+            self.graph_changed()
+            print(f"Successfully uploaded {len(graph)} triples and their provenance to Fuseki")
+            return True
         
         # Serialize the graph to Turtle format
         data = graph.serialize(format="turtle")
@@ -45,6 +141,7 @@ class KnowledgeGraphStore:
         response = requests.post(self.data_endpoint, data=data.encode("utf-8"), headers=headers)
         
         if response.status_code == 200 or response.status_code == 201:
+            self.graph_changed()
             print(f"Successfully uploaded {len(graph)} triples to Fuseki")
             return True
         else:
@@ -52,48 +149,169 @@ class KnowledgeGraphStore:
             print(response.text)
             return False
     
+    def upload_ntriples_file(self, graph_file):
+        """Stream an N-Triples (optionally gzipped) or N-Quads file to Fuseki without parsing it"""
+        if self.backend == "local":
+            return self.upload_graph(graph_file=graph_file)
+        content_type = "application/n-quads" if graph_io.detect_format(graph_file) == "nquads" else "application/n-triples"
+        headers = {"Content-Type": content_type}
+        if graph_file.lower().endswith(".gz"):
+            headers["Content-Encoding"] = "gzip"
+        with open(graph_file, 'rb') as f:
+            response = requests.post(self.data_endpoint, data=f, headers=headers)
+
+        if response.status_code == 200 or response.status_code == 201:
+            self.graph_changed()
+            print(f"Successfully uploaded {graph_file} to Fuseki")
+            return True
+        else:
+            print(f"Failed to upload data: {response.status_code}")
+            print(response.text)
+            return False
+
+    def post_ntriples(self, lines):
+        """POST a batch of N-Triples lines (or N-Quads, for named graphs) to the data endpoint"""
+        if self.backend == "local":
+            with self.profiler.stage("upload", items=len(lines)):
+                self.client.add_ntriples(lines)
+            return True
+        # Every N-Triples line is also an N-Quads line in the default graph
+        headers = {"Content-Type": "application/n-quads"}
+        with self.profiler.stage("upload", items=len(lines)):
+            response = requests.post(self.data_endpoint, data="".join(lines).encode("utf-8"), headers=headers)
+        if response.status_code == 200 or response.status_code == 201:
+            return True
+        print(f"Failed to upload data: {response.status_code}")
+        print(response.text)
+        return False
+
+    def upload_triples(self, triple_groups, batch_size=50000):
+        """Upload a stream of triple lists to Fuseki in batches of roughly batch_size triples.
+
+        Each list is sent whole, so blank nodes never get split across requests.
+        Returns True if every batch was accepted.
+        """
+        batch = []
+        uploaded = 0
+        success = True
+        for triples in triple_groups:
+            batch.extend(statement_to_nq(triple) for triple in triples)
+            if len(batch) >= batch_size:
+                success = self.post_ntriples(batch) and success
+                uploaded += len(batch)
+                print(f"Uploaded {uploaded} triples to Fuseki")
+                batch = []
+        if batch:
+            success = self.post_ntriples(batch) and success
+            uploaded += len(batch)
+            print(f"Uploaded {uploaded} triples to Fuseki")
+        if uploaded:
+            self.graph_changed()
+        return success
+
     def run_query(self, query):
-        """Run a SPARQL query against the Fuseki endpoint"""
-        sparql = SPARQLWrapper(self.sparql_endpoint)
-        sparql.setQuery(query)
-        sparql.setReturnFormat(JSON)
-        
+        """Run a SPARQL query against the Fuseki endpoint (served from the result cache if enabled)"""
+        if self.query_cache is not None:
+            results = self.query_cache.get(query)
+            if results is not None:
+                return results
         try:
-            results = sparql.query().convert()
-            return results
+            results = self.client.query(query)
         except Exception as e:
             print(f"Error executing query: {e}")
             return None
+        if self.query_cache is not None:
+            self.query_cache.put(query, results)
+        return results
+
+    def cache_stats(self):
+        """Hit/miss statistics of the result cache (None when caching is off)"""
+        return self.query_cache.stats() if self.query_cache is not None else None
+
+    def run_queries(self, queries):
+        """Run several queries concurrently over the pooled connections; None for any that failed"""
+        return list(self.client.thread_pool().map(self.run_query, queries))
+
+    async def run_query_async(self, query):
+        """Awaitable run_query, for keeping many queries in flight from one event loop"""
+        if self.query_cache is not None:
+            results = self.query_cache.get(query)
+            if results is not None:
+                return results
+        try:
+            results = await self.client.aquery(query)
+        except Exception as e:
+            print(f"Error executing query: {e}")
+            return None
+        if self.query_cache is not None:
+            self.query_cache.put(query, results)
+        return results
     
+    def batch_query(self, variables, pattern, keys, batch_size=200):
+        """Answer one query per key in a single round-trip by binding ?key with a VALUES block.
+
+        pattern is the WHERE body using ?key, variables the projected variables (without ?key).
+        Returns {key: results}, where each results dict has the usual SPARQL JSON shape and
+        holds only that key's bindings. Keys are sent in groups of batch_size per request.
+        """
+        keys = list(dict.fromkeys(keys))
+        split = {key: [] for key in keys}
+        projection = " ".join(f"?{variable}" for variable in ["key", *variables])
+        for start in range(0, len(keys), batch_size):
+            query = f"""
+            PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+            SELECT {projection} WHERE {{
+                {sparql_values("key", keys[start:start + batch_size])}
+                {pattern}
+            }}
+            """
+            results = self.run_query(query)
+            if results is None:
+                continue
+            for binding in results["results"]["bindings"]:
+                key = binding["key"]["value"]
+                if key in split:
+                    split[key].append({name: value for name, value in binding.items() if name != "key"})
+        return {key: {"head": {"vars": list(variables)}, "results": {"bindings": bindings}}
+                for key, bindings in split.items()}
+
+    def find_entities(self, labels, match="exact"):
+        """Entities with each label (match="exact") or whose label contains it case-insensitively"""
+        pattern = f"{ENTITY_PATTERNS[match]} ?entity a ?type ."
+        return self.batch_query(["entity", "label", "type"], pattern, labels)
+
+    def get_entities_attributes(self, labels, match="exact"):
+        """Outgoing properties of the entities matching each label, as in the entity_attributes template"""
+        pattern = f"{ENTITY_PATTERNS[match]} ?entity ?predicate ?object . OPTIONAL {{ ?object rdfs:label ?objLabel }}"
+        return self.batch_query(["predicate", "object", "objLabel"], pattern, labels)
+
+    def iter_query(self, query, page_size=None):
+        """Yield the bindings of a query row by row without holding the whole result.
+
+        By default the response is streamed as TSV; with page_size it is fetched in
+        LIMIT/OFFSET pages instead (the query should then have an ORDER BY).
+        """
+        if page_size:
+            for bindings in self.client.iter_pages(query, page_size):
+                yield from bindings
+        else:
+            yield from self.client.iter_bindings(query)
+
+    def iter_all_entities(self, page_size=None):
+        """Stream every entity with its label and type, see get_all_entities"""
+        return self.iter_query(ALL_ENTITIES_QUERY + (" ORDER BY ?entity" if page_size else ""), page_size)
+
+    def iter_all_relations(self, page_size=None):
+        """Stream every relation triple, see get_all_relations"""
+        return self.iter_query(ALL_RELATIONS_QUERY + (" ORDER BY ?subject ?predicate ?object" if page_size else ""), page_size)
+
     def get_all_entities(self):
         """Get all entities in the knowledge graph"""
-        query = """
-        PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-        SELECT DISTINCT ?entity ?label ?type
-        WHERE {
-            ?entity a ?type .
-            OPTIONAL { ?entity rdfs:label ?label }
-        }
-        """
-        return self.run_query(query)
+        return self.run_query(ALL_ENTITIES_QUERY)
     
     def get_all_relations(self):
         """Get all relationships in the knowledge graph"""
-        query = """
-        PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-        SELECT ?subject ?predicate ?object ?sLabel ?oLabel
-        WHERE {
-            ?subject ?predicate ?object .
-            
-            # Filter out RDF, RDFS and OWL properties
-            FILTER(!STRSTARTS(STR(?predicate), "http://www.w3.org/1999/02/22-rdf-syntax-ns#"))
-            FILTER(!STRSTARTS(STR(?predicate), "http://www.w3.org/2000/01/rdf-schema#"))
-            FILTER(!STRSTARTS(STR(?predicate), "http://www.w3.org/2002/07/owl#"))
-            
-            
-        }
-        """
-        return self.run_query(query)
+        return self.run_query(ALL_RELATIONS_QUERY)
 
 if __name__ == "__main__":
     store = KnowledgeGraphStore()
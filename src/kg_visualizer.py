@@ -1,14 +1,17 @@
 from pyvis.network import Network
-from SPARQLWrapper import SPARQLWrapper, JSON
+from sparql_client import get_client
 # import pandas as pd
 
 class PyvisKGVisualizer:
     def __init__(self, sparql_endpoint="http://localhost:3030/testkg/sparql"):
-        self.sparql = SPARQLWrapper(sparql_endpoint)
-        self.sparql.setReturnFormat(JSON)
+        self.sparql = get_client(sparql_endpoint)
     
     def fetch_kg_data(self):
         """Fetch knowledge graph data from SPARQL endpoint"""
+        return list(self.iter_kg_data())
+
+    def iter_kg_data(self):
+        """Yield (source, target, relation, source_label, target_label) edges as the result streams in"""
         query = """
         PREFIX foaf: <http://xmlns.com/foaf/0.1/>
         PREFIX ex: <http://example.org/>
@@ -29,11 +32,7 @@ class PyvisKGVisualizer:
         }
         """
         
-        self.sparql.setQuery(query)
-        results = self.sparql.query().convert()
-        
-        edges = []
-        for result in results["results"]["bindings"]:
+        for result in self.sparql.iter_bindings(query):
             s = result["s"]["value"]
             p = result["p"]["value"]
             o = result["o"]["value"]
@@ -43,14 +42,12 @@ class PyvisKGVisualizer:
             o_label = result["oLabel"]["value"] if "oLabel" in result else o.split('/')[-1]
             p_label = p.split('/')[-1]
             
-            edges.append((s, o, p_label, s_label, o_label))
-            
-        return edges
+            yield (s, o, p_label, s_label, o_label)
     
     def visualize(self, filename="kg_visualization.html", height="600px", width="100%"):
         """Create an interactive visualization"""
         # Get graph data
-        edges = self.fetch_kg_data()
+        edges = self.iter_kg_data()
         
         # Create network
         net = Network(height=height, width=width, directed=True, notebook=False)
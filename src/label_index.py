@@ -0,0 +1,57 @@
+from rdflib import RDF
+from rdflib.namespace import RDFS
+
+class LabelIndex:
+    """Label -> URIs, URI -> label and URI -> types lookups for the labelled nodes of a graph.
+
+    Built from the rdfs:label triples alone, so its cost grows with the number of labels
+    rather than the number of triples. Empty labels are skipped; `labels` lists each
+    distinct label once, in the order first seen.
+    """
+
+    def __init__(self):
+        self.label_uris = {}
+        self.uri_labels = {}
+        self.uri_types = {}
+
+    @classmethod
+    def from_graph(cls, graph):
+        index = cls()
+        for uri, _, label in graph.triples((None, RDFS.label, None)):
+            index.add(str(uri), str(label), [str(t) for t in graph.objects(uri, RDF.type)])
+        return index
+
+    def add(self, uri, label, types=()):
+        """Index one labelled node; returns True if the label was not known before"""
+        if not label.strip():
+            return False
+        # A node keeps its first label, the one queries and answers show
+        self.uri_labels.setdefault(uri, label)
+        known_types = self.uri_types.setdefault(uri, [])
+        known_types.extend(t for t in types if t not in known_types)
+        uris = self.label_uris.get(label)
+        if uris is None:
+            self.label_uris[label] = [uri]
+            return True
+        if uri not in uris:
+            uris.append(uri)
+        return False
+
+    @property
+    def labels(self):
+        return list(self.label_uris)
+
+    def uris(self, label):
+        return self.label_uris.get(label, [])
+
+    def label(self, uri):
+        return self.uri_labels.get(str(uri), "")
+
+    def types(self, uri):
+        return self.uri_types.get(str(uri), [])
+
+    def __len__(self):
+        return len(self.label_uris)
+
+    def __contains__(self, label):
+        return label in self.label_uris
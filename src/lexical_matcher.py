@@ -0,0 +1,70 @@
+import re
+import heapq
+from collections import Counter
+
+_NON_WORD = re.compile(r"[\W_]+")
+
+def normalize(text):
+    """Lowercase text with punctuation and runs of whitespace collapsed to single spaces"""
+    return _NON_WORD.sub(" ", text.lower()).strip()
+
+def trigrams(normalized):
+    """Character trigrams of already normalized text, padded so word edges count"""
+    padded = f"  {normalized} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class LexicalMatcher:
+    """Exact/normalized lookup plus a character-trigram inverted index over a list of labels.
+
+    Label ids are positions in the order labels were added, so they line up with the rows of
+    a vector index built over the same list. A normalized exact hit scores 1.0; other labels
+    score the Jaccard similarity of their trigram set with the query's.
+    """
+
+    def __init__(self, labels=()):
+        self.labels = []
+        self.exact = {}       # normalized label -> ids
+        self.postings = {}    # trigram -> ids
+        self.gram_counts = []
+        self.add(labels)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def add(self, labels):
+        """Index labels; their ids continue from the current size"""
+        for label in labels:
+            label_id = len(self.labels)
+            normalized = normalize(label)
+            grams = trigrams(normalized) if normalized else set()
+            self.labels.append(label)
+            self.gram_counts.append(len(grams))
+            self.exact.setdefault(normalized, []).append(label_id)
+            for gram in grams:
+                self.postings.setdefault(gram, []).append(label_id)
+
+    def search(self, text, top_k=1):
+        """The top_k labels for text as [(id, score), ...], best first"""
+        normalized = normalize(text)
+        if not normalized:
+            return []
+        scores = {label_id: 1.0 for label_id in self.exact.get(normalized, [])[:top_k]}
+        if len(scores) < top_k:
+            grams = trigrams(normalized)
+            shared = Counter()
+            for gram in grams:
+                shared.update(self.postings.get(gram, ()))
+            for label_id, count in shared.items():
+                if label_id not in scores:
+                    scores[label_id] = count / (len(grams) + self.gram_counts[label_id] - count)
+        return heapq.nlargest(top_k, scores.items(), key=lambda item: (item[1], -item[0]))
+
+    def similarity(self, text, label_id):
+        """Score of one label for text, on the same scale as search()"""
+        normalized, label = normalize(text), normalize(self.labels[label_id])
+        if not normalized or not label:
+            return 0.0
+        if normalized == label:
+            return 1.0
+        grams, label_grams = trigrams(normalized), trigrams(label)
+        return len(grams & label_grams) / len(grams | label_grams)
@@ -0,0 +1,101 @@
+import os
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from sparql_client import term_to_binding
+from sqlite_store import open_graph
+from nt_utils import parse_nq_line
+import graph_io
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class LocalSPARQLBackend:
+    """Runs SPARQL in-process against an rdflib graph, with the same methods and result shapes
+    as SPARQLClient, so KnowledgeGraphStore works without a Fuseki server.
+
+    graph is an rdflib Graph to share (e.g. the one NLQueryProcessor already loaded) or a
+    graph file path. A .sqlite path is opened writable, so uploaded triples persist; other
+    formats are loaded into memory and uploads last only as long as the process.
+    """
+
+    def __init__(self, graph=None, pool_size=4):
+        if graph is None:
+            graph = os.environ.get("KG_GRAPH_PATH", os.path.join(base_dir, "data/knowledge_graphs/knowledge_graph.ttl"))
+        # The graph file, if one was given; identifies the graph in cache keys
+        self.graph_path = os.path.abspath(graph) if isinstance(graph, str) else None
+        if isinstance(graph, str):
+            path = graph
+            if graph_io.detect_format(path) == "sqlite":
+                graph = open_graph(path)
+            else:
+                graph = graph_io.load_graph(path) if os.path.exists(path) else graph_io.new_graph(path)
+        self.graph = graph
+        self.pool_size = pool_size
+        # rdflib graphs (and the shared SQLite connection) are not safe for concurrent use
+        self.lock = threading.Lock()
+        self._pool = None
+
+    def _select(self, query):
+        with self.lock:
+            result = self.graph.query(query)
+            if result.type == "ASK":
+                return None, result.askAnswer
+            if result.type != "SELECT":
+                raise ValueError(f"Only SELECT and ASK queries return SPARQL results, got {result.type}")
+            variables = [str(var) for var in result.vars]
+            rows = [
+                {name: term_to_binding(row[i]) for i, name in enumerate(variables) if row[i] is not None}
+                for row in result
+            ]
+        return variables, rows
+
+    def query(self, query):
+        """Run a query and return results shaped like the SPARQL JSON results format"""
+        variables, rows = self._select(query)
+        if variables is None:
+            return {"head": {}, "boolean": rows}
+        return {"head": {"vars": variables}, "results": {"bindings": rows}}
+
+    def iter_bindings(self, query):
+        yield from self.query(query)["results"]["bindings"]
+
+    def iter_pages(self, query, page_size=10000):
+        bindings = self.query(query)["results"]["bindings"]
+        for start in range(0, len(bindings), page_size):
+            yield bindings[start:start + page_size]
+
+    def query_many(self, queries):
+        return [self.query(query) for query in queries]
+
+    async def aquery(self, query):
+        return await asyncio.get_running_loop().run_in_executor(self.thread_pool(), self.query, query)
+
+    async def aquery_many(self, queries):
+        return await asyncio.gather(*(self.aquery(query) for query in queries))
+
+    def thread_pool(self):
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(self.pool_size)
+        return self._pool
+
+    def add_graph(self, graph):
+        """Add every triple of graph; returns the number added"""
+        with self.lock:
+            before = len(self.graph)
+            graph_io.add_statements(self.graph, graph_io.iter_statements(graph))
+            return len(self.graph) - before
+
+    def add_ntriples(self, lines):
+        """Add statements given as N-Triples or N-Quads lines (quads only if the graph is a Dataset)"""
+        with self.lock:
+            before = len(self.graph)
+            graph_io.add_statements(self.graph, filter(None, map(parse_nq_line, lines)))
+            return len(self.graph) - before
+
+    def add_file(self, graph_file):
+        return self.add_graph(graph_io.load_graph(graph_file))
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
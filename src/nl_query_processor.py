@@ -1,116 +1,385 @@
 import os
 import re
 import json
-import spacy
-from sentence_transformers import SentenceTransformer, util
-from rdflib import Graph
+import time
+import atexit
+import shutil
+from collections import OrderedDict
+from sentence_transformers import SentenceTransformer
+from rdflib import URIRef
 from rdflib.namespace import RDFS
-# import numpy as np
+from nlp_profiles import load_pipeline
+from embedding_store import EmbeddingStore
+from label_index import LabelIndex
+from lexical_matcher import LexicalMatcher
+from entity_cache import EntityCache
+from vector_index import create_index, load_index
+from sparql_client import sparql_literal
+from nt_utils import term_to_nt
+import graph_io
+import numpy as np
 # from collections import defaultdict
 
 base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
+# New labels are indexed right away but the saved label index is only rewritten once this
+# many have accumulated (and at exit)
+LABEL_INDEX_SAVE_EVERY = 1000
+
+_REGEX_SPECIAL = re.compile(r"([\\.?*+^$|()\[\]{}-])")
+
+def regex_escape(text):
+    """text as a SPARQL (XPath) regular expression matching it literally"""
+    return _REGEX_SPECIAL.sub(r"\\\1", text)
+
+class QueryPlan:
+    """Everything derived from one analysis of a question: its type and target phrases, the
+    graph labels and entity URIs they resolved to, and the SPARQL with its explanation"""
+
+    def __init__(self, question, query_type, target, labels, entities, sparql, explanation):
+        self.question = question
+        self.query_type = query_type
+        self.target = target
+        self.labels = labels
+        self.entities = entities
+        self.sparql = sparql
+        self.explanation = explanation
+
+    def __repr__(self):
+        return f"QueryPlan(query_type={self.query_type!r}, target={self.target!r}, labels={self.labels!r})"
+
 class NLQueryProcessor:
-    def __init__(self, entity_cache_file=None):
+    def __init__(self, entity_cache_file=None, nlp_profile="accurate", graph_path=None, vector_index="auto",
+                 index_options=None, result_limit=100, plan_cache_size=1024, lexical_threshold=0.85,
+                 semantic_weight=0.5):
         
-        self.graph = Graph()
-        ttl_path = os.path.join(base_dir, "data/knowledge_graphs/knowledge_graph.ttl")
-        self.graph.parse(ttl_path, format="ttl")
+        # Any format graph_io knows (.ttl, .nt, .nt.gz, .kgb, .sqlite); a .sqlite store is opened
+        # read-only in place, so query workers share one on-disk graph instead of each parsing a copy
+        if graph_path is None:
+            graph_path = os.path.join(base_dir, "data/knowledge_graphs/knowledge_graph.ttl")
+        self.graph = graph_io.load_graph(graph_path)
 
         # Load language models
-        self.nlp = spacy.load("en_core_web_lg")
+        self.nlp = load_pipeline(nlp_profile)
         
         # Load sentence transformer model for semantic similarity
+        self.sentence_model_name = 'all-MiniLM-L6-v2'
         try:
-            self.sentence_model = SentenceTransformer('all-MiniLM-L6-v2')
+            self.sentence_model = SentenceTransformer(self.sentence_model_name)
         except:
             print("Error loading sentece transformer")
             return 
+
+        # Label embeddings persist across restarts, only unseen labels get encoded
+        self.embedding_store = EmbeddingStore(self.sentence_model_name)
         
         
-        self.unique_labels = set()
-
-        for s, p, o in self.graph.triples((None, None, None)):
-            s_label = self.get_label(self.graph, s)
-            o_label = self.get_label(self.graph, o)
-            # print(f"Subject: {s_label}, Object: {o_label}")
-            self.unique_labels.add(s_label)
-            self.unique_labels.add(o_label)
-        
-        self.kg_labels = list(self.unique_labels)
+        # One pass over the rdfs:label triples; kg_labels[i] is the label of embedding row i
+        self.label_index = LabelIndex.from_graph(self.graph)
+        self.kg_labels = self.label_index.labels
         # print("Labels from query processor ",self.kg_labels)
-        self.kg_label_embeddings = self.sentence_model.encode(self.kg_labels, convert_to_tensor=True)
+        # Nearest-label search: exact for small graphs, HNSW/IVF (see vector_index) for large ones
+        self.label_vector_index = self.load_label_vector_index(vector_index, index_options or {})
+        # Cheap lexical matching first; the sentence model only runs for mentions whose best
+        # lexical score is below lexical_threshold (ids line up with kg_labels as well)
+        self.lexical_matcher = LexicalMatcher(self.kg_labels)
+        self.lexical_threshold = lexical_threshold
+        self.semantic_weight = semantic_weight
 
-        # Template SPARQL queries
-        self.query_templates = {
-            "find_entity": """
+        # Entities seen in query results; merged into the label index on first use
+        self.entity_cache = EntityCache(entity_cache_file)
+        self.entity_cache_merged = False
+
+        # Normalized question -> QueryPlan, so repeated questions skip analysis entirely
+        self.plan_cache = OrderedDict()
+        self.plan_cache_size = plan_cache_size
+
+        # Template SPARQL queries. Entities are bound to their URIs with VALUES, so a query only
+        # touches the neighbourhood of the matched entities instead of scanning every label
+        self.result_limit = result_limit
+        prefixes = """
                 PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
                 PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-                PREFIX owl: <http://www.w3.org/2002/07/owl#>
+                PREFIX owl: <http://www.w3.org/2002/07/owl#>"""
+        self.query_templates = {
+            "find_entity": prefixes + """
                 SELECT ?entity ?label ?type WHERE {{
+                    VALUES ?entity {{ {entity} }}
                     ?entity rdfs:label ?label .
                     ?entity a ?type .
-                    FILTER(REGEX(?label, "{}", "i"))
-                }}
+                }} LIMIT {limit}
             """,
-            "find_relation_between": """
-                PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-                PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-                PREFIX owl: <http://www.w3.org/2002/07/owl#>
+            "find_relation_between": prefixes + """
                 SELECT ?subject ?predicate ?object ?sLabel ?oLabel WHERE {{
+                    VALUES ?subject {{ {entity} }}
+                    VALUES ?object {{ {entity2} }}
                     ?subject ?predicate ?object .
                     ?subject rdfs:label ?sLabel .
                     ?object rdfs:label ?oLabel .
-                    FILTER(REGEX(?sLabel, "{}", "i"))
-                    FILTER(REGEX(?oLabel, "{}", "i"))
-                }}
+                }} LIMIT {limit}
             """,
-            "entity_attributes": """
-                PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-                PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-                PREFIX owl: <http://www.w3.org/2002/07/owl#>
+            "entity_attributes": prefixes + """
+                SELECT ?predicate ?object ?objLabel WHERE {{
+                    VALUES ?entity {{ {entity} }}
+                    ?entity ?predicate ?object .
+                    OPTIONAL {{ ?object rdfs:label ?objLabel }}
+                }} LIMIT {limit}
+            """,
+            "entity_related": prefixes + """
+                SELECT ?relation ?entity ?label WHERE {{
+                    {{
+                        VALUES ?subject {{ {entity} }}
+                        ?subject ?relation ?entity .
+                        ?entity rdfs:label ?label .
+                    }} UNION {{
+                        VALUES ?object {{ {entity} }}
+                        ?entity ?relation ?object .
+                        ?entity rdfs:label ?label .
+                    }}
+                }} LIMIT {limit}
+            """
+        }
+
+        # Fallbacks for text that matches no label of the loaded graph: a case-insensitive
+        # REGEX scan over the labels, with the text escaped as a literal pattern
+        self.regex_templates = {
+            "find_entity": prefixes + """
+                SELECT ?entity ?label ?type WHERE {{
+                    ?entity rdfs:label ?label .
+                    ?entity a ?type .
+                    FILTER(REGEX(?label, {entity}, "i"))
+                }} LIMIT {limit}
+            """,
+            "find_relation_between": prefixes + """
+                SELECT ?subject ?predicate ?object ?sLabel ?oLabel WHERE {{
+                    ?subject ?predicate ?object .
+                    ?subject rdfs:label ?sLabel .
+                    ?object rdfs:label ?oLabel .
+                    FILTER(REGEX(?sLabel, {entity}, "i"))
+                    FILTER(REGEX(?oLabel, {entity2}, "i"))
+                }} LIMIT {limit}
+            """,
+            "entity_attributes": prefixes + """
                 SELECT ?predicate ?object ?objLabel WHERE {{
                     ?entity rdfs:label ?label .
-                    FILTER(REGEX(?label, "{}", "i"))
+                    FILTER(REGEX(?label, {entity}, "i"))
                     ?entity ?predicate ?object .
                     OPTIONAL {{ ?object rdfs:label ?objLabel }}
-                }}
+                }} LIMIT {limit}
             """,
-            "entity_related": """
-                PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-                PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-                PREFIX owl: <http://www.w3.org/2002/07/owl#>
+            "entity_related": prefixes + """
                 SELECT ?relation ?entity ?label WHERE {{
                     {{
                         ?subject rdfs:label ?sLabel .
                         ?subject ?relation ?entity .
                         ?entity rdfs:label ?label .
-                        FILTER(REGEX(?sLabel, "{}", "i"))
+                        FILTER(REGEX(?sLabel, {entity}, "i"))
                     }} UNION {{
                         ?entity ?relation ?object .
                         ?entity rdfs:label ?label .
                         ?object rdfs:label ?oLabel .
-                        FILTER(REGEX(?oLabel, "{}", "i"))
+                        FILTER(REGEX(?oLabel, {entity}, "i"))
                     }}
-                }}
+                }} LIMIT {limit}
             """
         }
         
 
     def get_label(self,graph, node):
+        if graph is self.graph:
+            return self.label_index.label(node)
         label = graph.value(node, RDFS.label)
         return str(label) if label else ""
     
     
+    def load_label_vector_index(self, kind="auto", options=None):
+        """Vector index over kg_labels (row i is label i).
+
+        Approximate indexes are saved next to the label embeddings. On the next start a saved
+        index whose labels are a prefix of kg_labels only has the new labels added to it.
+        """
+        vectors = self.embedding_store.encode(self.sentence_model, self.kg_labels)
+        self.label_index_root = os.path.join(self.embedding_store.store_dir, "label_index")
+        self.unsaved_labels = 0
+        atexit.register(self.flush_label_vector_index)
+        saved_dir = self.saved_label_index_dir()
+
+        index, indexed = None, 0
+        if saved_dir is not None:
+            with open(os.path.join(saved_dir, "labels.json"), 'r') as f:
+                saved_labels = json.load(f)
+            index = load_index(saved_dir)
+            if (kind not in ("auto", index.kind) or len(saved_labels) != len(index)
+                    or saved_labels != self.kg_labels[:len(saved_labels)]):
+                index = None
+            else:
+                indexed = len(saved_labels)
+
+        if index is None:
+            dim = self.sentence_model.get_sentence_embedding_dimension()
+            index = create_index(dim, kind, size=len(self.kg_labels), **(options or {}))
+        if indexed < len(self.kg_labels):
+            index.add(vectors[indexed:])
+            self.save_label_vector_index(index)
+        return index
+
+    def saved_label_index_dir(self):
+        """Directory of the last complete saved label index, or None"""
+        current_path = os.path.join(self.label_index_root, "CURRENT")
+        if not os.path.exists(current_path):
+            return None
+        with open(current_path, 'r') as f:
+            saved_dir = os.path.join(self.label_index_root, f.read().strip())
+        return saved_dir if os.path.isdir(saved_dir) else None
+
+    def save_label_vector_index(self, index=None):
+        """Persist an approximate label index with the labels of its rows (exact ones are cheap to rebuild).
+
+        Every save goes to a new directory and CURRENT is switched to it atomically, so other
+        workers never load a half-written index or an index with another save's labels.
+        """
+        index = index or self.label_vector_index
+        self.unsaved_labels = 0
+        if index.kind == "exact":
+            return
+        name = f"{time.time_ns()}-{os.getpid()}"
+        index.save(os.path.join(self.label_index_root, name))
+        with open(os.path.join(self.label_index_root, name, "labels.json"), 'w') as f:
+            json.dump(self.kg_labels, f)
+        previous = self.saved_label_index_dir()
+        tmp_path = os.path.join(self.label_index_root, f"CURRENT.{os.getpid()}.tmp")
+        with open(tmp_path, 'w') as f:
+            f.write(name)
+        os.replace(tmp_path, os.path.join(self.label_index_root, "CURRENT"))
+        # Keep the previous save for workers that may still be loading it
+        keep = {name, "CURRENT", os.path.basename(previous) if previous else None}
+        for entry in os.listdir(self.label_index_root):
+            path = os.path.join(self.label_index_root, entry)
+            if entry in keep or entry.endswith(".tmp"):
+                continue
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.remove(path)
+
+    def flush_label_vector_index(self):
+        """Save the label index if labels were added since the last save (also run at exit)"""
+        if self.unsaved_labels:
+            self.save_label_vector_index()
+
+    def add_labels(self, labels):
+        """Make new labels searchable without rebuilding the vector index"""
+        known = set(self.kg_labels)
+        new_labels = [label for label in dict.fromkeys(labels) if label.strip() and label not in known]
+        if not new_labels:
+            return []
+        self.label_vector_index.add(self.embedding_store.encode(self.sentence_model, new_labels))
+        self.kg_labels.extend(new_labels)
+        self.lexical_matcher.add(new_labels)
+        self.unsaved_labels += len(new_labels)
+        if self.unsaved_labels >= LABEL_INDEX_SAVE_EVERY:
+            self.save_label_vector_index()
+        return new_labels
+
+    def update_entity_cache(self, entities):
+        """Remember entities from query result bindings (with ?entity, ?label and optionally ?type).
+
+        Labels not seen before are added to the label index and embedded and indexed on their
+        own, without re-encoding the others. Returns the new labels.
+        """
+        self.ensure_entity_cache()
+        new_labels = []
+        for binding in entities:
+            label = binding["label"]["value"]
+            uri = binding["entity"]["value"]
+            entity_type = binding.get("type", {}).get("value", "")
+            if self.entity_cache.add(label, uri, entity_type) and self.label_index.add(uri, label, [entity_type] if entity_type else []):
+                new_labels.append(label)
+        if new_labels:
+            self.add_labels(new_labels)
+            # Cached plans may have resolved these names to other labels or to the REGEX fallback
+            self.clear_plan_cache()
+        return new_labels
+
+    def ensure_entity_cache(self):
+        """Merge the persisted entity cache into the label index (once, on first use).
+
+        Entries whose URI is not a subject of the loaded graph are stale and skipped, as are
+        labels that only differ in case from a label the index already has.
+        """
+        if self.entity_cache_merged:
+            return
+        self.entity_cache_merged = True
+        known = {label.lower() for label in self.kg_labels}
+        new_labels = []
+        for key, entry in self.entity_cache.items():
+            label = entry.get("label", key)
+            if (URIRef(entry["uri"]), None, None) not in self.graph:
+                continue
+            if label.lower() in known and label not in self.label_index:
+                continue
+            if self.label_index.add(entry["uri"], label, [entry["type"]] if entry.get("type") else []):
+                known.add(label.lower())
+                new_labels.append(label)
+        self.add_labels(new_labels)
+
     def get_similar_kg_label(self, query_text, top_k=1):
-        query_embedding = self.sentence_model.encode(query_text, convert_to_tensor=True)
-        hits = util.semantic_search(query_embedding, self.kg_label_embeddings, top_k=top_k)[0]
-        # print(query_text, "\n")
-        # print([self.kg_labels[hit['corpus_id']] for hit in hits])
-        return [self.kg_labels[hit['corpus_id']] for hit in hits]
-
-    def extract_question_type(self, question):
-        """Determine the type of question being asked"""
+        return [label for label, score, lexical, semantic in self.score_labels(query_text, top_k)]
+
+    def score_labels(self, query_text, top_k=1, candidates=10):
+        """Graph labels for a mention as [(label, combined, lexical, semantic), ...], best first.
+
+        A confident lexical match (normalized exact hit, or trigram similarity of at least
+        lexical_threshold) is returned without running the sentence model, with semantic None.
+        Otherwise lexical and dense candidates are pooled and ranked by
+        semantic_weight * semantic + (1 - semantic_weight) * lexical.
+        """
+        self.ensure_entity_cache()
+        pool = max(top_k, candidates)
+        lexical = dict(self.lexical_matcher.search(query_text, pool))
+        if lexical and max(lexical.values()) >= self.lexical_threshold:
+            hits = sorted(lexical.items(), key=lambda item: -item[1])[:top_k]
+            return [(self.kg_labels[label_id], score, score, None) for label_id, score in hits]
+
+        query_embedding = self.sentence_model.encode(query_text, convert_to_numpy=True)
+        semantic = dict(self.label_vector_index.search(query_embedding, pool)[0])
+        # Lexical candidates the dense search missed; their vectors come from the embedding store
+        missing = [label_id for label_id in lexical if label_id not in semantic]
+        if missing:
+            vectors = self.embedding_store.encode(self.sentence_model, [self.kg_labels[label_id] for label_id in missing])
+            norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query_embedding)
+            semantic.update(zip(missing, (vectors @ query_embedding / np.maximum(norms, 1e-12)).tolist()))
+
+        scored = []
+        for label_id, semantic_score in semantic.items():
+            lexical_score = lexical.get(label_id)
+            if lexical_score is None:
+                lexical_score = self.lexical_matcher.similarity(query_text, label_id)
+            combined = self.semantic_weight * semantic_score + (1 - self.semantic_weight) * lexical_score
+            scored.append((self.kg_labels[label_id], combined, lexical_score, semantic_score))
+        scored.sort(key=lambda item: -item[1])
+        return scored[:top_k]
+
+    def extract_question_type(self, question, doc=None):
+        """Determine the type of question being asked (doc: the question already parsed by spaCy)"""
+        q_type, target = self.match_question_patterns(question)
+        if q_type is not None:
+            return q_type, target
+
+        # Extract entities from question for general query
+        if doc is None:
+            doc = self.nlp(question)
+        entities = [ent.text for ent in doc.ents]
+        
+        # print("entities" , entities)
+
+        if entities:
+            return "entity_related", entities[0]
+        
+        return "general", None
+
+    def match_question_patterns(self, question):
+        """Question type and target from the relation/attribute patterns alone; (None, None) if none match"""
         question_lower = question.lower()
         
         # Check for relationship questions
@@ -140,55 +409,87 @@ class NLQueryProcessor:
             if match:
                 entity = match.group(1)
                 return "attribute", entity
-        
-        # Extract entities from question for general query
-        doc = self.nlp(question)
-        entities = [ent.text for ent in doc.ents]
-        
-        # print("entities" , entities)
 
-        if entities:
-            return "entity_related", entities[0]
-        
-        return "general", None
-    
+        return None, None
+
     def nl_to_sparql(self, question):
         """Convert natural language question to SPARQL query"""
-        # Process the question
-        doc = self.nlp(question)
-        
-        # Extract question type and target
-        q_type, target = self.extract_question_type(question)
+        return self.analyze(question).sparql
+
+    def analyze(self, question):
+        """Analyze a question once (spaCy runs at most once) into a QueryPlan; plans are cached"""
+        self.ensure_entity_cache()
+        key = " ".join(question.split())
+        plan = self.plan_cache.get(key)
+        if plan is not None:
+            self.plan_cache.move_to_end(key)
+            return plan
+
+        # The patterns need no parse; spaCy only runs when they do not match
+        doc = None
+        q_type, target = self.match_question_patterns(question)
+        if q_type is None:
+            doc = self.nlp(question)
+            entities = [ent.text for ent in doc.ents]
+            q_type, target = ("entity_related", entities[0]) if entities else ("general", None)
         # print("qtype", q_type , "target", target)
 
         # Generate SPARQL query based on question type
         if q_type == "relation" and isinstance(target, tuple) and len(target) == 2:
             entity1_sim = self.get_similar_kg_label(target[0])[0]
             entity2_sim = self.get_similar_kg_label(target[1])[0]
-            return self.query_templates["find_relation_between"].format(entity1_sim, entity2_sim)
+            template, labels = "find_relation_between", [entity1_sim, entity2_sim]
         
         elif q_type == "attribute" and target:
-            entity_sim = self.get_similar_kg_label(target)[0]
-            return self.query_templates["entity_attributes"].format(entity_sim)
+            template, labels = "entity_attributes", [self.get_similar_kg_label(target)[0]]
         
         elif q_type == "entity_related" and target:
-            entity_sim = self.get_similar_kg_label(target)[0]
-            return self.query_templates["entity_related"].format(entity_sim, entity_sim)
+            template, labels = "entity_related", [self.get_similar_kg_label(target)[0]]
         
         else:
+            if doc is None:
+                doc = self.nlp(question)
             # Extract all named entities from question
             entities = [ent.text for ent in doc.ents]
             # print("Entities in the question : ",entities)
-            if entities:
-                return self.query_templates["find_entity"].format(entities[0])
-            else:
-                # Extract key noun phrases if no named entities
-                noun_chunks = [chunk.text for chunk in doc.noun_chunks]
-                if noun_chunks:
-                    return self.query_templates["find_entity"].format(noun_chunks[0])
-        
-        # Default fallback query
-        return self.query_templates["find_entity"].format(question.replace("?", "").strip())
+            # Extract key noun phrases if no named entities (needs a profile with the parser)
+            noun_chunks = [chunk.text for chunk in doc.noun_chunks] if not entities and doc.has_annotation("DEP") else []
+            # Default fallback: the whole question
+            phrases = entities or noun_chunks or [question.replace("?", "").strip()]
+            template, labels = "find_entity", [phrases[0]]
+
+        plan = QueryPlan(
+            question=question,
+            query_type=q_type,
+            target=target,
+            labels=labels,
+            entities={label: self.label_index.uris(label) for label in labels},
+            sparql=self.render_query(template, *labels),
+            explanation=self.query_explanation(q_type, target)
+        )
+        self.plan_cache[key] = plan
+        if len(self.plan_cache) > self.plan_cache_size:
+            self.plan_cache.popitem(last=False)
+        return plan
+
+    def clear_plan_cache(self):
+        """Forget cached plans, e.g. after labels were added to the graph"""
+        self.plan_cache.clear()
+
+    def render_query(self, template, *labels):
+        """Fill a query template for the given labels.
+
+        Labels of the loaded graph are bound to their entity URIs; if any label is unknown the
+        REGEX fallback template is used with every label escaped as a literal pattern.
+        """
+        uris = [self.label_index.uris(label) for label in labels]
+        if all(uris):
+            values = [" ".join(term_to_nt(URIRef(uri)) for uri in entity_uris) for entity_uris in uris]
+            templates = self.query_templates
+        else:
+            values = [sparql_literal(regex_escape(label)) for label in labels]
+            templates = self.regex_templates
+        return templates[template].format(entity=values[0], entity2=values[-1], limit=self.result_limit)
     
     def query_explanation(self, query_type, target):
         """Generate human-readable explanation of the SPARQL query"""
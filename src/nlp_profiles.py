@@ -0,0 +1,86 @@
+import os
+import json
+import time
+import spacy
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Named SpaCy pipeline setups. Components nobody reads are excluded so they are neither loaded nor run.
+#   accurate - the full large model, as the extractor and query processor always used
+#   fast     - small model for extraction: ents, sents (senter instead of parser), pos_ and lemma_
+#   query    - question parsing: ents and noun_chunks (which need the parser and tagger)
+PROFILES = {
+    "accurate": {
+        "model": "en_core_web_lg",
+        "exclude": [],
+        "enable": []
+    },
+    "fast": {
+        "model": "en_core_web_sm",
+        "exclude": ["parser"],
+        "enable": ["senter"]
+    },
+    "query": {
+        "model": "en_core_web_lg",
+        "exclude": ["lemmatizer"],
+        "enable": []
+    }
+}
+
+def load_pipeline(profile="accurate"):
+    """Load the SpaCy pipeline for a named profile, downloading the model if needed"""
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown SpaCy profile '{profile}', expected one of {sorted(PROFILES)}")
+    config = PROFILES[profile]
+
+    start = time.perf_counter()
+    try:
+        nlp = spacy.load(config["model"], exclude=config["exclude"])
+    except OSError:
+        # Download if not available
+        print("Downloading SpaCy model...")
+        os.system(f"python -m spacy download {config['model']}")
+        nlp = spacy.load(config["model"], exclude=config["exclude"])
+
+    for name in config["enable"]:
+        if name in nlp.disabled:
+            nlp.enable_pipe(name)
+    load_seconds = time.perf_counter() - start
+
+    nlp.meta["kg_profile"] = profile
+    nlp.meta["kg_load_seconds"] = load_seconds
+    print(f"Loaded SpaCy profile '{profile}' ({config['model']}: {', '.join(nlp.pipe_names)}) in {load_seconds:.2f}s")
+    return nlp
+
+def measure_throughput(nlp, texts, batch_size=32):
+    """Words per second for running the pipeline over texts"""
+    start = time.perf_counter()
+    words = 0
+    for doc in nlp.pipe(texts, batch_size=batch_size):
+        words += sum(1 for token in doc if not token.is_punct and not token.is_space)
+    elapsed = time.perf_counter() - start
+    return words / elapsed if elapsed > 0 else 0.0
+
+def benchmark_profiles(texts, profiles=None):
+    """Load each profile and report its load time and throughput on texts"""
+    reports = []
+    for profile in profiles or PROFILES:
+        nlp = load_pipeline(profile)
+        reports.append({
+            "profile": profile,
+            "model": PROFILES[profile]["model"],
+            "components": nlp.pipe_names,
+            "load_seconds": round(nlp.meta["kg_load_seconds"], 3),
+            "words_per_second": round(measure_throughput(nlp, texts), 1)
+        })
+    return reports
+
+if __name__ == "__main__":
+    # Benchmark on the sentences already extracted from the PDFs
+    knowledge_file = os.path.join(base_dir, "data/extracted/combined_knowledge.json")
+    with open(knowledge_file, 'r') as f:
+        knowledge = json.load(f)
+    sample_texts = list(dict.fromkeys(relation["sentence"] for relation in knowledge["relations"]))
+
+    for report in benchmark_profiles(sample_texts):
+        print(json.dumps(report))
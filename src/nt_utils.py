@@ -0,0 +1,102 @@
+import re
+from rdflib import URIRef, BNode, Literal
+
+# N-Triples string escapes (the Turtle shorthand rdflib's n3() falls back to is not valid here)
+_ESCAPES = str.maketrans({
+    "\\": "\\\\",
+    '"': '\\"',
+    "\n": "\\n",
+    "\r": "\\r",
+    "\t": "\\t"
+})
+
+def escape_nt_string(value):
+    return value.translate(_ESCAPES)
+
+def term_to_nt(term):
+    """Serialize a single RDF term in N-Triples syntax"""
+    if isinstance(term, URIRef):
+        return f"<{term}>"
+    if isinstance(term, BNode):
+        return f"_:{term}"
+    if isinstance(term, Literal):
+        text = f'"{escape_nt_string(str(term))}"'
+        if term.language:
+            return f"{text}@{term.language}"
+        if term.datatype:
+            return f"{text}^^<{term.datatype}>"
+        return text
+    raise TypeError(f"Cannot serialize {term!r} as N-Triples")
+
+def triple_to_nt(triple):
+    """One N-Triples line, newline included"""
+    s, p, o = triple
+    return f"{term_to_nt(s)} {term_to_nt(p)} {term_to_nt(o)} .\n"
+
+def quad_to_nq(triple, graph_name):
+    """One N-Quads line placing the triple in the named graph graph_name"""
+    s, p, o = triple
+    return f"{term_to_nt(s)} {term_to_nt(p)} {term_to_nt(o)} {term_to_nt(graph_name)} .\n"
+
+def statement_to_nq(statement):
+    """N-Quads line for a triple (default graph) or an (s, p, o, graph name) quad"""
+    if len(statement) == 4:
+        return quad_to_nq(statement[:3], statement[3])
+    return triple_to_nt(statement)
+
+_UNESCAPES = {"t": "\t", "b": "\b", "n": "\n", "r": "\r", "f": "\f", '"': '"', "'": "'", "\\": "\\"}
+_ESCAPE_RE = re.compile(r'\\(?:u([0-9A-Fa-f]{4})|U([0-9A-Fa-f]{8})|(.))')
+
+def unescape_nt_string(value):
+    if "\\" not in value:
+        return value
+
+    def replace(match):
+        code = match.group(1) or match.group(2)
+        if code:
+            return chr(int(code, 16))
+        return _UNESCAPES.get(match.group(3), match.group(3))
+
+    return _ESCAPE_RE.sub(replace, value)
+
+_TERM = r'''<[^>]*>|_:[^\s]+|"(?:[^"\\]|\\.)*"(?:@[a-zA-Z][a-zA-Z0-9-]*|\^\^<[^>]*>)?'''
+_LINE_RE = re.compile(rf'''^\s*({_TERM})\s+({_TERM})\s+({_TERM})\s*\.\s*$''')
+_QUAD_RE = re.compile(rf'''^\s*({_TERM})\s+({_TERM})\s+({_TERM})(?:\s+(<[^>]*>|_:[^\s]+))?\s*\.\s*$''')
+_LITERAL_RE = re.compile(r'''^"((?:[^"\\]|\\.)*)"(?:@([a-zA-Z][a-zA-Z0-9-]*)|\^\^<([^>]*)>)?$''')
+
+def parse_term(text):
+    """Parse one N-Triples term back into an rdflib term; blank node labels are kept as-is"""
+    if text.startswith("<"):
+        return URIRef(unescape_nt_string(text[1:-1]))
+    if text.startswith("_:"):
+        return BNode(text[2:])
+    match = _LITERAL_RE.match(text)
+    if match is None:
+        raise ValueError(f"Invalid N-Triples term: {text}")
+    value, language, datatype = match.groups()
+    return Literal(unescape_nt_string(value), lang=language, datatype=URIRef(datatype) if datatype else None)
+
+def parse_nt_line(line):
+    """Parse one N-Triples line into (s, p, o); None for blank lines and comments.
+
+    Unlike rdflib's parser, blank node labels map to the same BNode in every call, so
+    separate chunks of one file can be parsed independently.
+    """
+    stripped = line.strip()
+    if not stripped or stripped.startswith("#"):
+        return None
+    match = _LINE_RE.match(stripped)
+    if match is None:
+        raise ValueError(f"Invalid N-Triples line: {stripped}")
+    return tuple(parse_term(term) for term in match.groups())
+
+def parse_nq_line(line):
+    """Parse one N-Quads line into (s, p, o) for the default graph or (s, p, o, graph name);
+    None for blank lines and comments"""
+    stripped = line.strip()
+    if not stripped or stripped.startswith("#"):
+        return None
+    match = _QUAD_RE.match(stripped)
+    if match is None:
+        raise ValueError(f"Invalid N-Quads line: {stripped}")
+    return tuple(parse_term(term) for term in match.groups() if term is not None)
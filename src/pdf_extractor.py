@@ -1,42 +1,83 @@
 import os
 import json
 import fitz  
-import spacy
 import re
+import multiprocessing
 from rdflib import Graph, Namespace
-from sentence_transformers import SentenceTransformer, util
+from sentence_transformers import SentenceTransformer
+from relation_matcher import RelationMatcher
+from ingest_manifest import IngestManifest
+from nlp_profiles import load_pipeline
+from embedding_store import EmbeddingStore
+from entity_resolver import EntityResolver
+from instrumentation import PipelineProfiler, logger
 
 base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) 
 
+# Part of the incremental-ingest version, so changes to the output re-extract every PDF
+# (2: relation endpoints use the same ids as the entities)
+EXTRACTOR_VERSION = 2
+
+# Extractor owned by each worker process of the parallel ingest, so the models load once per worker
+_worker_extractor = None
+
+def _init_worker(extractor_kwargs, profile_stages, trace_memory=False):
+    global _worker_extractor
+    profiler = PipelineProfiler(enabled=profile_stages, trace_memory=trace_memory)
+    _worker_extractor = PDFKnowledgeExtractor(profiler=profiler, **extractor_kwargs)
+
+def _extract_batch(args):
+    pdf_paths, batch_size = args
+    results = _worker_extractor.extract_batch(pdf_paths, batch_size)
+    # Pool workers exit without running atexit handlers
+    _worker_extractor.embedding_store.flush()
+    # Stage timings travel back with the results so the parent can report them
+    return results, _worker_extractor.profiler.drain()
+
 class PDFKnowledgeExtractor:
-    def __init__(self, models_dir="models"):
+    def __init__(self, models_dir="models", max_pair_distance=None, max_pairs_per_sentence=None, nlp_profile="accurate",
+                 profiler=None):
 
+        self.models_dir = models_dir
+        self.profiler = profiler or PipelineProfiler(enabled=False)
+        self.nlp_profile = nlp_profile
         self.relation_threshold = 0.3
+        self.sentence_model_name = 'all-MiniLM-L6-v2'
+        self.ontology_path = os.path.join(base_dir, "ontology/travel_ontology.ttl")
 
-        # Load SpaCy model for NER (Named Entity Recognition)
+        # Optional caps on relation candidates; None keeps every entity pair of a sentence
+        self.max_pair_distance = max_pair_distance
+        self.max_pairs_per_sentence = max_pairs_per_sentence
 
         try:
-            self.model = SentenceTransformer('all-MiniLM-L6-v2')
+            self.model = SentenceTransformer(self.sentence_model_name)
         except:
             print("Error while loading sentence transformer")
             return
 
-        try:
-            self.nlp = spacy.load("en_core_web_lg")
-        except:
-            # Download if not available
-            print("Downloading SpaCy model...")
-            os.system("python -m spacy download en_core_web_lg")
-            self.nlp = spacy.load("en_core_web_lg")
+        # Load SpaCy model for NER (Named Entity Recognition)
+        self.nlp = load_pipeline(self.nlp_profile)
 
+        self.embedding_store = EmbeddingStore(self.sentence_model_name)
         self.known_relations = self.load_known_relations()
-        self.known_relation_embeddings = {
-            rel: self.model.encode(rel, convert_to_tensor=True) for rel in self.known_relations
-        }
+        self.relation_matcher = RelationMatcher(
+            self.model, self.known_relations, self.relation_threshold, embedding_store=self.embedding_store
+        )
     
     def load_known_relations(self,ontology_path=None):
 
-        ontology_path = os.path.join(base_dir, "ontology/travel_ontology.ttl")
+        if ontology_path is None:
+            ontology_path = self.ontology_path
+
+        # Reuse the relations parsed on an earlier start if the ontology file is unchanged
+        ontology_hash = IngestManifest.file_hash(ontology_path)
+        cache_path = os.path.join(self.embedding_store.store_dir, "known_relations.json")
+        if os.path.exists(cache_path):
+            with open(cache_path, 'r') as f:
+                cached = json.load(f)
+            if cached["ontology_hash"] == ontology_hash:
+                return set(cached["relations"])
+
         g = Graph()
         g.parse(ontology_path, format="turtle")
 
@@ -48,27 +89,43 @@ class PDFKnowledgeExtractor:
                 relation = str(s).split('#')[-1]  # Get property name
                 known_relations.add(relation)
         # print(known_relations)
+        # Written to a temp file and renamed, since other workers may be reading it at startup
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({"ontology_hash": ontology_hash, "relations": sorted(known_relations)}, f)
+        os.replace(tmp_path, cache_path)
         return known_relations
 
-    def find_closest_relation(self, candidate):
-        candidate_embedding = self.model.encode(candidate, convert_to_tensor=True)
-        best_match, highest_score = None, 0
-
-        for rel, rel_embedding in self.known_relation_embeddings.items():
-            score = util.pytorch_cos_sim(candidate_embedding, rel_embedding).item()
-            if score > highest_score:
-                best_match, highest_score = rel, score
+    def pipeline_versions(self):
+        """Versions of everything that shapes the extracted knowledge, used by incremental ingest"""
+        model_version = {
+            "extractor_version": EXTRACTOR_VERSION,
+            "spacy_model": f"{self.nlp.meta['lang']}_{self.nlp.meta['name']}-{self.nlp.meta['version']}",
+            "spacy_components": self.nlp.pipe_names,
+            "sentence_model": self.sentence_model_name,
+            "relation_threshold": self.relation_threshold,
+            "max_pair_distance": self.max_pair_distance,
+            "max_pairs_per_sentence": self.max_pairs_per_sentence,
+            "nlp_profile": self.nlp_profile
+        }
+        return {
+            "model_version": json.dumps(model_version, sort_keys=True),
+            "ontology_version": IngestManifest.file_hash(self.ontology_path)
+        }
 
-        return (best_match, highest_score) if highest_score >= self.relation_threshold else (None, highest_score)
+    def find_closest_relation(self, candidate):
+        return self.relation_matcher.match(candidate)
 
     def extract_text_from_pdf(self, pdf_path):
         """Extract text from PDF file"""
         text = ""
         try:
-            doc = fitz.open(pdf_path)
-            for page_num in range(len(doc)):
-                page = doc.load_page(page_num)
-                text += page.get_text()
+            with self.profiler.stage("text_extraction", pdf=pdf_path) as record:
+                doc = fitz.open(pdf_path)
+                for page_num in range(len(doc)):
+                    page = doc.load_page(page_num)
+                    text += page.get_text()
+                record["items"] = len(doc)
             print(f"Extracted {len(text)} characters from {pdf_path}")
             return text
         except Exception as e:
@@ -89,18 +146,55 @@ class PDFKnowledgeExtractor:
     def extract_entities_and_relations(self, text):
         """Extract entities and potential relationships from text"""
         # Process with SpaCy
-        doc = self.nlp(text)
+        with self.profiler.stage("ner") as record:
+            doc = self.nlp(text)
+            record["items"] = len(doc)
+        return self.extract_from_doc(doc)
+
+    def iter_entity_pairs(self, doc, entities):
+        """Yield (entity1, entity2, sentence, tokens between them) for entities sharing a sentence.
+
+        `entities` must be in document order (as doc.ents is). Entities are assigned to
+        sentences in a single sweep, and pairs further apart than max_pair_distance tokens
+        or beyond max_pairs_per_sentence are skipped.
+        """
+        index = 0
+        for sent in doc.sents:
+            logger.debug("%s", sent)
+            # Entities starting before this sentence belong to an earlier one or cross its boundary
+            while index < len(entities) and entities[index].start < sent.start:
+                index += 1
+
+            sent_entities = []
+            while index < len(entities) and entities[index].start < sent.end:
+                if entities[index].end <= sent.end:
+                    sent_entities.append(entities[index])
+                index += 1
+
+            pairs = 0
+            for i, entity1 in enumerate(sent_entities[:-1]):
+                if self.max_pairs_per_sentence is not None and pairs >= self.max_pairs_per_sentence:
+                    break
+                for entity2 in sent_entities[i+1:]:
+                    if self.max_pair_distance is not None and entity2.start - entity1.end > self.max_pair_distance:
+                        # Later entities are only further away
+                        break
+                    if self.max_pairs_per_sentence is not None and pairs >= self.max_pairs_per_sentence:
+                        break
+                    pairs += 1
+                    yield entity1, entity2, sent, doc[entity1.end:entity2.start]
+
+    def extract_from_doc(self, doc):
+        """Extract entities and potential relationships from a parsed SpaCy doc"""
         entities = {}
         relations = []
 
         # Extract entities
         
         allowed_entity_types = {"ORG", "GPE", "LOC", "PERSON", "PRODUCT", "FAC", "EVENT", "WORK_OF_ART", "LAW", "NORP"}
+        allowed_ents = [ent for ent in doc.ents if ent.label_ in allowed_entity_types]
 
-
-        for ent in doc.ents:
-            if ent.label_ not in allowed_entity_types:
-                continue
+        for ent in allowed_ents:
             entity_id = f"{ent.label_}_{self.sanitize_uri(ent.text)}"
             entities[entity_id] = {
                 "text": ent.text,
@@ -111,57 +205,77 @@ class PDFKnowledgeExtractor:
         
         # Extract potential relationships
         
-        sentences = list(doc.sents)
-        # print(sentences)
-        for sent in sentences:
-            print(sent,"\n")
-            allowed_entity_types = {"ORG", "GPE", "LOC", "PERSON", "PRODUCT", "FAC", "EVENT", "WORK_OF_ART", "LAW", "NORP"}
-            sent_entities = [
-                ent for ent in doc.ents 
-                if ent.start >= sent.start and ent.end <= sent.end and ent.label_ in allowed_entity_types
-            ]
-
-            # print(sent_entities)
-            if len(sent_entities) >= 2:
-                for i, entity1 in enumerate(sent_entities[:-1]):
-                    for entity2 in sent_entities[i+1:]:
-                        
-                        between_tokens = [token for token in doc if entity1.end <= token.i < entity2.start]
-                        # print("Entity 1 " , entity1 ,"Entity 2 ", entity2, "between tokens" , between_tokens)
-                        verbs = [token.lemma_ for token in between_tokens if token.pos_ == "VERB"]
-                        
-                        relation_type = "related_to"
-                        if verbs:
-                            # print(print("Entity 1 " , entity1 ,"Entity 2 ", entity2, "between tokens" , verbs))
-                            relation_type = "_".join(verbs)
-                        
-                        match, score = self.find_closest_relation(relation_type)
-                        if match:
-                            relation_type = match
-                            entity1_id = f"{entity1.label_}_{entity1.text.replace(' ', '_')}"
-                            entity2_id = f"{entity2.label_}_{entity2.text.replace(' ', '_')}"
-                            
-                            relations.append({
-                                "source": entity1_id,
-                                "target": entity2_id,
-                                "type": relation_type,
-                                "sentence": sent.text
-                            })
-                        # else :
-                        #     print(f"Unknown relation: {relation_type} (score: {score:.2f})")
-                        
+        # Collect every candidate first so the relation matcher scores the whole document in one batch
+        with self.profiler.stage("relation_scoring") as record:
+            candidates = []
+            for entity1, entity2, sent, between_tokens in self.iter_entity_pairs(doc, allowed_ents):
+                # print("Entity 1 " , entity1 ,"Entity 2 ", entity2, "between tokens" , between_tokens)
+                verbs = [token.lemma_ for token in between_tokens if token.pos_ == "VERB"]
+                
+                relation_type = "related_to"
+                if verbs:
+                    relation_type = "_".join(verbs)
+                
+                candidates.append((entity1, entity2, sent, relation_type))
+
+            matches = self.relation_matcher.match_many([relation_type for _, _, _, relation_type in candidates])
+            record["items"] = len(candidates)
+        for (entity1, entity2, sent, relation_type), (match, score) in zip(candidates, matches):
+            if match:
+                relation_type = match
+                entity1_id = f"{entity1.label_}_{self.sanitize_uri(entity1.text)}"
+                entity2_id = f"{entity2.label_}_{self.sanitize_uri(entity2.text)}"
+                
+                relations.append({
+                    "source": entity1_id,
+                    "target": entity2_id,
+                    "type": relation_type,
+                    "sentence": sent.text
+                })
+            # else :
+            #     print(f"Unknown relation: {relation_type} (score: {score:.2f})")
         
         return {
             "entities": entities,
             "relations": relations
         }
     
+    def extract_batch(self, pdf_paths, batch_size=8):
+        """Extract knowledge from several PDFs, running NER over them with nlp.pipe"""
+        texts = [self.extract_text_from_pdf(pdf_path) for pdf_path in pdf_paths]
+        docs = self.nlp.pipe([text for text in texts if text], batch_size=batch_size)
+
+        results = []
+        for pdf_path, text in zip(pdf_paths, texts):
+            self.profiler.pdf = pdf_path
+            knowledge = None
+            if text:
+                with self.profiler.stage("ner") as record:
+                    doc = next(docs)
+                    record["items"] = len(doc)
+                knowledge = self.extract_from_doc(doc)
+            results.append((pdf_path, knowledge))
+        return results
+
+    def save_knowledge(self, knowledge, pdf_path, output_dir):
+        """Save the knowledge extracted from one PDF next to the other extracted files"""
+        pdf_name = os.path.basename(pdf_path).replace('.pdf', '')
+        output_path = os.path.join(output_dir, f"{pdf_name}_knowledge.json")
+        
+        with open(output_path, 'w') as f:
+            json.dump(knowledge, f, indent=2)
+        
+        print(f"Extracted {len(knowledge['entities'])} entities and {len(knowledge['relations'])} relations")
+        print(f"Saved to {output_path}")
+        return output_path
+
     def process_pdf(self, pdf_path, output_dir="data/extracted"):
         """Process PDF and extract knowledge"""
         # Create output directory if it doesn't exist
         os.makedirs(output_dir, exist_ok=True)
         
         # Extract text from PDF
+        self.profiler.pdf = pdf_path
         text = self.extract_text_from_pdf(pdf_path)
         
         if not text:
@@ -174,18 +288,74 @@ class PDFKnowledgeExtractor:
         knowledge = self.extract_entities_and_relations(text)
         
         # Save extracted knowledge
-        pdf_name = os.path.basename(pdf_path).replace('.pdf', '')
-        output_path = os.path.join(output_dir, f"{pdf_name}_knowledge.json")
-        
-        with open(output_path, 'w') as f:
-            json.dump(knowledge, f, indent=2)
-        
-        print(f"Extracted {len(knowledge['entities'])} entities and {len(knowledge['relations'])} relations")
-        print(f"Saved to {output_path}")
+        self.save_knowledge(knowledge, pdf_path, output_dir)
         
         return knowledge
+
+    def iter_extracted(self, pdf_paths, n_process=1, batch_size=8):
+        """Yield (pdf_path, knowledge) in input order, fanning batches out to worker processes"""
+        if n_process <= 1:
+            for pdf_path in pdf_paths:
+                self.profiler.pdf = pdf_path
+                text = self.extract_text_from_pdf(pdf_path)
+                yield pdf_path, (self.extract_entities_and_relations(text) if text else None)
+            return
+
+        batches = [
+            (pdf_paths[i:i + batch_size], batch_size)
+            for i in range(0, len(pdf_paths), batch_size)
+        ]
+        ctx = multiprocessing.get_context("spawn")
+        extractor_kwargs = {
+            "models_dir": self.models_dir,
+            "max_pair_distance": self.max_pair_distance,
+            "max_pairs_per_sentence": self.max_pairs_per_sentence,
+            "nlp_profile": self.nlp_profile,
+        }
+        with ctx.Pool(n_process, initializer=_init_worker, initargs=(extractor_kwargs, self.profiler.enabled, self.profiler.trace_memory)) as pool:
+            # imap keeps the results in submission order, so merging stays deterministic
+            for results, records in pool.imap(_extract_batch, batches):
+                self.profiler.extend(records)
+                for pdf_path, knowledge in results:
+                    self.profiler.pdf = pdf_path
+                    yield pdf_path, knowledge
     
-    def process_directory(self, pdf_dir=None, output_dir=None):
+    def iter_directory(self, pdf_dir=None, output_dir=None, n_process=1, batch_size=8, save=True):
+        """Yield the knowledge of each PDF in a directory as soon as it is extracted.
+
+        Nothing is merged in memory; per-file *_knowledge.json files are still written
+        when save=True so the file-based stages can be used for debugging.
+        """
+        if pdf_dir is None:
+            pdf_dir = os.path.join(base_dir, "data/pdfs")
+        if output_dir is None:
+            output_dir = os.path.join(base_dir, "data/extracted")
+        if save:
+            os.makedirs(output_dir, exist_ok=True)
+
+        pdf_paths = [
+            os.path.join(pdf_dir, filename)
+            for filename in os.listdir(pdf_dir)
+            if filename.lower().endswith('.pdf')
+        ]
+
+        for pdf_path, knowledge in self.iter_extracted(pdf_paths, n_process, batch_size):
+            if knowledge:
+                if save:
+                    self.save_knowledge(knowledge, pdf_path, output_dir)
+                yield knowledge
+
+    def process_directory(self, pdf_dir=None, output_dir=None, n_process=1, batch_size=8, incremental=False,
+                          resolve_entities=False):
+        """Process every PDF in a directory and merge the results.
+
+        With n_process > 1 the PDFs are split into batches of batch_size and parsed
+        by a pool of worker processes; the outputs are the same as the sequential run.
+        With incremental=True a manifest of content hashes and pipeline versions is kept
+        in output_dir, unchanged PDFs reuse their existing *_knowledge.json and the
+        outputs of deleted PDFs are dropped. With resolve_entities=True spelling variants
+        of the same entity are merged in the combined knowledge (see EntityResolver).
+        """
         
         all_knowledge = {
             "entities": {},
@@ -196,21 +366,72 @@ class PDFKnowledgeExtractor:
             pdf_dir = os.path.join(base_dir, "data/pdfs")
         if output_dir is None:
             output_dir = os.path.join(base_dir, "data/extracted")
+        os.makedirs(output_dir, exist_ok=True)
+
+        pdf_paths = [
+            os.path.join(pdf_dir, filename)
+            for filename in os.listdir(pdf_dir)
+            if filename.lower().endswith('.pdf')
+        ]
+
+        manifest = None
+        unchanged = set()
+        if incremental:
+            manifest = IngestManifest(os.path.join(output_dir, "manifest.json"))
+            versions = self.pipeline_versions()
+            content_hashes = {pdf_path: IngestManifest.file_hash(pdf_path) for pdf_path in pdf_paths}
+            unchanged = {
+                pdf_path for pdf_path in pdf_paths
+                if manifest.is_current(os.path.basename(pdf_path), content_hashes[pdf_path], versions)
+            }
+
+            # Drop whatever deleted PDFs contributed
+            current = {os.path.basename(pdf_path) for pdf_path in pdf_paths}
+            for filename in manifest.filenames() - current:
+                entry = manifest.remove(filename)
+                if entry["output_path"] and os.path.exists(entry["output_path"]):
+                    os.remove(entry["output_path"])
+                print(f"Removed {filename} from the knowledge base")
+
+            print(f"Skipping {len(unchanged)} unchanged PDFs, extracting {len(pdf_paths) - len(unchanged)}")
+
+        changed = [pdf_path for pdf_path in pdf_paths if pdf_path not in unchanged]
+        extracted = self.iter_extracted(changed, n_process, batch_size)
+
+        # Walk the directory order so the combined file is the same whichever files were re-extracted
+        for pdf_path in pdf_paths:
+            filename = os.path.basename(pdf_path)
+            if pdf_path in unchanged:
+                output_path = manifest.entries[filename]["output_path"]
+                if output_path is None:
+                    continue
+                with open(output_path, 'r') as f:
+                    knowledge = json.load(f)
+            else:
+                _, knowledge = next(extracted)
+                output_path = self.save_knowledge(knowledge, pdf_path, output_dir) if knowledge else None
+                if manifest is not None:
+                    manifest.record(filename, content_hashes[pdf_path], versions, output_path)
+
+            # print(knowledge)
+            if knowledge:
+                # Merge knowledge
+                all_knowledge["entities"].update(knowledge["entities"])
+                all_knowledge["relations"].extend(knowledge["relations"])
+        # Shut down the worker pool, if any
+        extracted.close()
+
+        if manifest is not None:
+            manifest.save()
 
-        for filename in os.listdir(pdf_dir):
-            if filename.lower().endswith('.pdf'):
-                pdf_path = os.path.join(pdf_dir, filename)
-                knowledge = self.process_pdf(pdf_path, output_dir)
-                # print(knowledge)
-                if knowledge:
-                    # Merge knowledge
-                    all_knowledge["entities"].update(knowledge["entities"])
-                    all_knowledge["relations"].extend(knowledge["relations"])
+        if resolve_entities:
+            all_knowledge = EntityResolver(embedding_model=self.model).resolve(all_knowledge)
         
         # Save combined knowledge
         output_path = os.path.join(output_dir, "combined_knowledge.json")
         with open(output_path, 'w') as f:
             json.dump(all_knowledge, f, indent=2)
+        self.embedding_store.flush()
         
         print(f"Combined knowledge saved to {output_path}")
         return all_knowledge
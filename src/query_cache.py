@@ -0,0 +1,170 @@
+import os
+import re
+import json
+import time
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# String literals are kept verbatim, whitespace elsewhere is collapsed
+_LITERAL_OR_SPACE = re.compile(r'("(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\')|\s+')
+
+def normalize_query(query):
+    """Query text with insignificant whitespace removed, so reformatted queries share an entry"""
+    return _LITERAL_OR_SPACE.sub(lambda m: m.group(1) or " ", query).strip()
+
+def cache_dir(dataset, source):
+    """Cache directory of a dataset served by source (e.g. the server URL); datasets of the
+    same name on different servers get different directories"""
+    digest = hashlib.sha1(source.encode("utf-8")).hexdigest()[:12]
+    return os.path.join(base_dir, "data/cache/queries", f"{dataset}-{digest}")
+
+def default_version_file(dataset, source):
+    return os.path.join(cache_dir(dataset, source), "graph_version")
+
+def bump_version(version_file):
+    """Mark the graph as changed; every cache using version_file stops serving older results"""
+    os.makedirs(os.path.dirname(version_file), exist_ok=True)
+    tmp_path = f"{version_file}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(f"{time.time_ns()}-{os.getpid()}")
+    os.replace(tmp_path, version_file)
+
+class QueryCache:
+    """LRU cache of SPARQL results keyed on normalized query text and the graph version.
+
+    The graph version lives in version_file so that an upload from any process invalidates
+    the caches of all query processes. Entries expire after ttl seconds and the memory tier
+    is bounded by both max_entries and max_bytes (JSON size of the results). Results are kept
+    serialized, so every get() returns a fresh copy the caller may modify. With disk_dir
+    set, results are also kept on disk per version and survive restarts; directories of
+    older versions are removed once the version changes.
+    """
+
+    def __init__(self, version_file, max_entries=1000, max_bytes=64 * 1024 * 1024, ttl=3600, disk_dir=None):
+        self.version_file = version_file
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        self.counts = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+        self._version = None
+        self._version_mtime = -1
+
+    def version(self):
+        """Current graph version; re-read only when the version file changes"""
+        try:
+            mtime = os.stat(self.version_file).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime != self._version_mtime:
+            if mtime is None:
+                version = "0"
+            else:
+                with open(self.version_file) as f:
+                    version = f.read().strip()
+            if version != self._version:
+                self._invalidate(version)
+            self._version, self._version_mtime = version, mtime
+        return self._version
+
+    def _invalidate(self, version):
+        """Drop results of every version but this one, in memory and on disk"""
+        if self._version is not None:
+            self.counts["invalidations"] += 1
+        self.entries.clear()
+        self.total_bytes = 0
+        if self.disk_dir and os.path.isdir(self.disk_dir):
+            current = self._version_dir(version)
+            for name in os.listdir(self.disk_dir):
+                if name != current:
+                    shutil.rmtree(os.path.join(self.disk_dir, name), ignore_errors=True)
+
+    def key(self, query):
+        return hashlib.sha256(normalize_query(query).encode("utf-8")).hexdigest()
+
+    def _version_dir(self, version):
+        return hashlib.sha1(version.encode("utf-8")).hexdigest()[:16]
+
+    def _disk_path(self, version, key):
+        return os.path.join(self.disk_dir, self._version_dir(version), f"{key}.json")
+
+    def get(self, query):
+        """Cached results for query, or None"""
+        with self.lock:
+            version = self.version()
+            key = self.key(query)
+            entry = self.entries.get(key)
+            if entry is not None:
+                expires, size, data = entry
+                if expires > time.time():
+                    self.entries.move_to_end(key)
+                    self.counts["hits"] += 1
+                    return json.loads(data)
+                del self.entries[key]
+                self.total_bytes -= size
+                self.counts["expirations"] += 1
+
+            if self.disk_dir:
+                try:
+                    with open(self._disk_path(version, key)) as f:
+                        stored = json.load(f)
+                except (OSError, ValueError):
+                    stored = None
+                if stored is not None and stored["expires"] > time.time():
+                    self._store(key, stored["results"], stored["expires"])
+                    self.counts["disk_hits"] += 1
+                    return stored["results"]
+
+            self.counts["misses"] += 1
+            return None
+
+    def put(self, query, results):
+        with self.lock:
+            version = self.version()
+            key = self.key(query)
+            expires = time.time() + self.ttl
+            data = self._store(key, results, expires)
+            if self.disk_dir and data is not None:
+                path = self._disk_path(version, key)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                with open(tmp_path, 'w') as f:
+                    f.write(f'{{"expires": {expires}, "results": {data}}}')
+                os.replace(tmp_path, path)
+
+    def _store(self, key, results, expires):
+        """Add to the memory tier and evict down to the bounds; None if results are too large to keep"""
+        data = json.dumps(results)
+        size = len(data)
+        if size > self.max_bytes:
+            return None
+        previous = self.entries.pop(key, None)
+        if previous is not None:
+            self.total_bytes -= previous[1]
+        self.entries[key] = (expires, size, data)
+        self.total_bytes += size
+        while len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes:
+            _, (_, evicted_size, _) = self.entries.popitem(last=False)
+            self.total_bytes -= evicted_size
+            self.counts["evictions"] += 1
+        return data
+
+    def stats(self):
+        """Hit/miss counters and current size, for sizing the cache"""
+        with self.lock:
+            lookups = self.counts["hits"] + self.counts["disk_hits"] + self.counts["misses"]
+            return {
+                **self.counts,
+                "hit_rate": round((self.counts["hits"] + self.counts["disk_hits"]) / lookups, 3) if lookups else None,
+                "entries": len(self.entries),
+                "bytes": self.total_bytes,
+                "version": self._version
+            }
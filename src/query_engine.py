@@ -4,35 +4,52 @@ from kg_store import KnowledgeGraphStore
 from generate_llm import answer_from_kgllm
 
 class QueryEngine:
-    def __init__(self, fuseki_url="http://localhost:3030", dataset="kg"):
-        self.kg_store = KnowledgeGraphStore(fuseki_url, dataset)
-        self.nl_processor = NLQueryProcessor()
+    def __init__(self, fuseki_url="http://localhost:3030", dataset="kg", nlp_profile="accurate", cache_results=True,
+                 backend=None):
+        self.nl_processor = NLQueryProcessor(nlp_profile=nlp_profile)
+        # Users repeat the same questions, so results are cached until the next upload.
+        # The local backend queries the graph the processor has already loaded.
+        self.kg_store = KnowledgeGraphStore(fuseki_url, dataset, cache_results=cache_results, backend=backend,
+                                            graph=self.nl_processor.graph)
     
     def process_natural_language_query(self, question):
         """Process a natural language query and return results"""
-        # Convert natural language to SPARQL
-        query_type, target = self.nl_processor.extract_question_type(question)
-        sparql_query = self.nl_processor.nl_to_sparql(question)
-        explanation = self.nl_processor.query_explanation(query_type, target)
-        print("Query : " , sparql_query)
+        # Convert natural language to SPARQL (one analysis, cached for repeated questions)
+        plan = self.nl_processor.analyze(question)
+        print("Query : " , plan.sparql)
         print("end query")
         # Execute SPARQL query
-        results = self.kg_store.run_query(sparql_query)
+        results = self.kg_store.run_query(plan.sparql)
         
         # print("result:: ",results)
         # Format results
-        formatted_results = self.format_results(results, query_type)
+        formatted_results = self.format_results(results, plan.query_type)
         
         return {
             "question": question,
-            "query_type": query_type,
-            "target": target,
-            "sparql_query": sparql_query,
-            "explanation": explanation,
+            "query_type": plan.query_type,
+            "target": plan.target,
+            "sparql_query": plan.sparql,
+            "explanation": plan.explanation,
             "results": formatted_results,
-            "raw_results": results
+            "raw_results": results,
+            "plan": plan
         }
     
+    def find_entities(self, names):
+        """Look up several entities in one query; returns {name: formatted results}"""
+        return self._batch(names, self.kg_store.find_entities, "entity")
+
+    def describe_entities(self, names):
+        """Attributes of several entities in one query; returns {name: formatted results}"""
+        return self._batch(names, self.kg_store.get_entities_attributes, "attribute")
+
+    def _batch(self, names, lookup, query_type):
+        # Names are mapped to their closest graph labels so the query can match labels exactly
+        labels = {name: self.nl_processor.get_similar_kg_label(name)[0] for name in names}
+        results = lookup(labels.values())
+        return {name: self.format_results(results[label], query_type) for name, label in labels.items()}
+
     def format_results(self, results, query_type):
         """Format SPARQL query results for user-friendly display"""
         if not results or "results" not in results or "bindings" not in results["results"]:
@@ -0,0 +1,68 @@
+from collections import OrderedDict
+import torch
+from sentence_transformers import util
+
+class RelationMatcher:
+    """Map candidate verb phrases onto the closest known ontology relation"""
+
+    def __init__(self, model, relations, threshold=0.3, cache_size=10000, embedding_store=None):
+        self.model = model
+        self.relations = list(relations)
+        self.threshold = threshold
+        self.cache_size = cache_size
+
+        # candidate -> (relation or None, score), most recently used last
+        self.cache = OrderedDict()
+
+        # One row per ontology property so a whole batch is scored with a single matrix product
+        if not self.relations:
+            self.relation_matrix = None
+        elif embedding_store is not None:
+            self.relation_matrix = torch.from_numpy(embedding_store.encode(model, self.relations)).to(model.device)
+        else:
+            self.relation_matrix = self.model.encode(self.relations, convert_to_tensor=True)
+
+    def _decide(self, index, score):
+        # Same rule as the old per-property loop: the best score has to beat 0 and then the threshold
+        if score <= 0:
+            return None, 0
+        if score >= self.threshold:
+            return self.relations[index], score
+        return None, score
+
+    def _remember(self, candidate, result):
+        self.cache[candidate] = result
+        self.cache.move_to_end(candidate)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def match_many(self, candidates):
+        """Return (relation, score) for every candidate, encoding only the unseen ones in one batch"""
+        resolved = {}
+        missing = []
+        for candidate in dict.fromkeys(candidates):
+            if candidate in self.cache:
+                self.cache.move_to_end(candidate)
+                resolved[candidate] = self.cache[candidate]
+            else:
+                missing.append(candidate)
+
+        if missing:
+            if self.relation_matrix is None:
+                scored = [(None, 0)] * len(missing)
+            else:
+                embeddings = self.model.encode(missing, convert_to_tensor=True)
+                best_scores, best_indices = util.cos_sim(embeddings, self.relation_matrix).max(dim=1)
+                scored = [
+                    self._decide(index, score)
+                    for index, score in zip(best_indices.tolist(), best_scores.tolist())
+                ]
+            for candidate, result in zip(missing, scored):
+                resolved[candidate] = result
+                self._remember(candidate, result)
+
+        return [resolved[candidate] for candidate in candidates]
+
+    def match(self, candidate):
+        """Return (relation, score) for a single candidate"""
+        return self.match_many([candidate])[0]
@@ -0,0 +1,150 @@
+import asyncio
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from rdflib import URIRef, BNode, Literal
+from rdflib.namespace import XSD
+from nt_utils import parse_term, escape_nt_string
+
+def parse_tsv_term(text):
+    """Parse one cell of a SPARQL TSV result; None for an unbound variable.
+
+    Cells are N-Triples terms, except that numbers and booleans may be written bare.
+    """
+    if not text:
+        return None
+    if text[0] in '<"_':
+        return parse_term(text)
+    if text in ("true", "false"):
+        datatype = XSD.boolean
+    elif "e" in text.lower():
+        datatype = XSD.double
+    elif "." in text:
+        datatype = XSD.decimal
+    else:
+        datatype = XSD.integer
+    return Literal(text, datatype=datatype)
+
+def sparql_literal(value):
+    """A Python string as a quoted SPARQL string literal"""
+    return f'"{escape_nt_string(str(value))}"'
+
+def sparql_values(variable, values):
+    """VALUES block binding ?variable to each of the given strings"""
+    return f"VALUES ?{variable} {{ {' '.join(sparql_literal(value) for value in values)} }}"
+
+def term_to_binding(term):
+    """An rdflib term in the shape of a SPARQL JSON results binding"""
+    if term is None:
+        return None
+    if isinstance(term, URIRef):
+        return {"type": "uri", "value": str(term)}
+    if isinstance(term, BNode):
+        return {"type": "bnode", "value": str(term)}
+    binding = {"type": "literal", "value": str(term)}
+    if term.language:
+        binding["xml:lang"] = term.language
+    elif term.datatype:
+        binding["datatype"] = str(term.datatype)
+    return binding
+
+class SPARQLClient:
+    """SPARQL endpoint client over a pooled keep-alive HTTP session.
+
+    Unlike a SPARQLWrapper per query, connections are reused across queries and threads.
+    The async methods run queries on a thread pool of pool_size, so one event loop can keep
+    up to pool_size queries in flight.
+    """
+
+    def __init__(self, endpoint, timeout=30, pool_size=10, retries=2):
+        self.endpoint = endpoint
+        self.timeout = timeout
+        self.pool_size = pool_size
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retries)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers["Accept"] = "application/sparql-results+json"
+        self._pool = None
+
+    def query(self, query):
+        """Run a SPARQL query and return the parsed JSON results; raises on HTTP errors"""
+        response = self.session.post(self.endpoint, data={"query": query}, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def iter_bindings(self, query):
+        """Yield result rows one by one as JSON-style binding dicts, in constant memory.
+
+        The response is requested as TSV and parsed line by line while it streams in,
+        instead of loading one JSON document for the whole result.
+        """
+        headers = {"Accept": "text/tab-separated-values"}
+        with self.session.post(self.endpoint, data={"query": query}, headers=headers,
+                               timeout=self.timeout, stream=True) as response:
+            response.raise_for_status()
+            lines = response.iter_lines(decode_unicode=False)
+            header = next(lines, None)
+            if header is None:
+                return
+            variables = [name.lstrip("?$") for name in header.decode("utf-8").split("\t")]
+            for line in lines:
+                if not line:
+                    continue
+                cells = line.decode("utf-8").split("\t")
+                yield {
+                    name: term_to_binding(parse_tsv_term(cell))
+                    for name, cell in zip(variables, cells) if cell
+                }
+
+    def iter_pages(self, query, page_size=10000):
+        """Yield the bindings of query one page at a time using LIMIT/OFFSET.
+
+        The query must not have its own LIMIT/OFFSET, and should have an ORDER BY so
+        that pages are stable.
+        """
+        offset = 0
+        while True:
+            bindings = self.query(f"{query}\nLIMIT {page_size} OFFSET {offset}")["results"]["bindings"]
+            if bindings:
+                yield bindings
+            if len(bindings) < page_size:
+                return
+            offset += page_size
+
+    def query_many(self, queries):
+        """Run queries concurrently; results are returned in the order of queries"""
+        return list(self.thread_pool().map(self.query, queries))
+
+    async def aquery(self, query):
+        return await asyncio.get_running_loop().run_in_executor(self.thread_pool(), self.query, query)
+
+    async def aquery_many(self, queries):
+        return await asyncio.gather(*(self.aquery(query) for query in queries))
+
+    def thread_pool(self):
+        """Thread pool the concurrent and async queries run on"""
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(self.pool_size)
+        return self._pool
+
+    def close(self):
+        self.session.close()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_client(endpoint, **options):
+    """Client for endpoint and options shared by everything in this process; callers asking
+    for different options (timeout, pool size, retries) get a client of their own"""
+    key = (endpoint, tuple(sorted(options.items())))
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = SPARQLClient(endpoint, **options)
+        return client
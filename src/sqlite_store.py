@@ -0,0 +1,199 @@
+import os
+import sqlite3
+from functools import lru_cache
+from itertools import islice
+from rdflib import Graph, URIRef
+from rdflib.store import Store, VALID_STORE
+from nt_utils import term_to_nt, parse_term, parse_nt_line
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS terms (id INTEGER PRIMARY KEY, term TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS triples (s INTEGER NOT NULL, p INTEGER NOT NULL, o INTEGER NOT NULL,
+                                    PRIMARY KEY (s, p, o)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS triples_pos ON triples (p, o, s);
+CREATE INDEX IF NOT EXISTS triples_osp ON triples (o, s, p);
+CREATE TABLE IF NOT EXISTS namespaces (prefix TEXT PRIMARY KEY, uri TEXT NOT NULL);
+"""
+
+@lru_cache(maxsize=200000)
+def _decode(text):
+    return parse_term(text)
+
+class SQLiteStore(Store):
+    """rdflib store kept in an embedded SQLite database.
+
+    Terms are stored once in N-Triples form and triples as integer ids with (s,p,o),
+    (p,o,s) and (o,s,p) indexes, so every triple pattern is an index lookup. Several
+    processes can open the same file with read_only=True and share the OS page cache
+    instead of each holding a full in-memory copy.
+    """
+
+    context_aware = False
+    formula_aware = False
+    transaction_aware = False
+    graph_aware = False
+
+    def __init__(self, configuration=None, identifier=None, read_only=False):
+        super().__init__(None, identifier)
+        self.read_only = read_only
+        self.connection = None
+        self.path = None
+        if configuration:
+            self.open(configuration, create=not read_only)
+
+    def open(self, configuration, create=False):
+        self.path = configuration
+        if self.read_only:
+            self.connection = sqlite3.connect(f"file:{configuration}?mode=ro", uri=True, check_same_thread=False)
+            self.connection.execute("PRAGMA query_only = ON")
+        else:
+            if not create and not os.path.exists(configuration):
+                raise FileNotFoundError(configuration)
+            os.makedirs(os.path.dirname(os.path.abspath(configuration)), exist_ok=True)
+            self.connection = sqlite3.connect(configuration, check_same_thread=False)
+            self.connection.execute("PRAGMA journal_mode = WAL")
+            self.connection.executescript(_SCHEMA)
+        return VALID_STORE
+
+    def close(self, commit_pending_transaction=False):
+        if self.connection is not None:
+            if not self.read_only:
+                self.connection.commit()
+            self.connection.close()
+            self.connection = None
+
+    def commit(self):
+        self.connection.commit()
+
+    def rollback(self):
+        self.connection.rollback()
+
+    def clear(self):
+        """Remove every triple, term and namespace binding"""
+        with self.connection:
+            self.connection.execute("DELETE FROM triples")
+            self.connection.execute("DELETE FROM terms")
+            self.connection.execute("DELETE FROM namespaces")
+
+    def _term_id(self, term, create=False):
+        text = term_to_nt(term)
+        row = self.connection.execute("SELECT id FROM terms WHERE term = ?", (text,)).fetchone()
+        if row is not None:
+            return row[0]
+        if not create:
+            return None
+        return self.connection.execute("INSERT INTO terms (term) VALUES (?)", (text,)).lastrowid
+
+    def add(self, triple, context=None, quoted=False):
+        """Add one triple in its own transaction; use addN/bulk_load (or parse) for many"""
+        with self.connection:
+            ids = tuple(self._term_id(term, create=True) for term in triple)
+            self.connection.execute("INSERT OR IGNORE INTO triples (s, p, o) VALUES (?, ?, ?)", ids)
+        super().add(triple, context, quoted)
+
+    def addN(self, quads):
+        self.bulk_load((s, p, o) for s, p, o, _ in quads)
+
+    def bulk_load(self, triples, batch_size=100000):
+        """Insert triples in large transactions; much faster than adding them one by one"""
+        triples = iter(triples)
+        loaded = 0
+        while True:
+            batch = list(islice(triples, batch_size))
+            if not batch:
+                break
+            terms = {term_to_nt(term) for triple in batch for term in triple}
+            with self.connection:
+                self.connection.executemany("INSERT OR IGNORE INTO terms (term) VALUES (?)", ((term,) for term in terms))
+                self.connection.executemany(
+                    """INSERT OR IGNORE INTO triples (s, p, o)
+                       SELECT (SELECT id FROM terms WHERE term = ?), (SELECT id FROM terms WHERE term = ?),
+                              (SELECT id FROM terms WHERE term = ?)""",
+                    (tuple(term_to_nt(term) for term in triple) for triple in batch)
+                )
+            loaded += len(batch)
+        return loaded
+
+    def _pattern_sql(self, triple_pattern):
+        """WHERE clause and parameters for a pattern; None if a bound term is not in the store"""
+        clauses, params = [], []
+        for column, term in zip(("s", "p", "o"), triple_pattern):
+            if term is None:
+                continue
+            term_id = self._term_id(term)
+            if term_id is None:
+                return None
+            clauses.append(f"t.{column} = ?")
+            params.append(term_id)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def triples(self, triple_pattern, context=None):
+        pattern = self._pattern_sql(triple_pattern)
+        if pattern is None:
+            return
+        where, params = pattern
+        cursor = self.connection.execute(
+            "SELECT ts.term, tp.term, tobj.term FROM triples t "
+            "JOIN terms ts ON ts.id = t.s JOIN terms tp ON tp.id = t.p JOIN terms tobj ON tobj.id = t.o"
+            + where, params
+        )
+        for s, p, o in cursor:
+            yield (_decode(s), _decode(p), _decode(o)), iter(())
+
+    def remove(self, triple_pattern, context=None):
+        pattern = self._pattern_sql(triple_pattern)
+        if pattern is None:
+            return
+        where, params = pattern
+        with self.connection:
+            self.connection.execute("DELETE FROM triples AS t" + where, params)
+        super().remove(triple_pattern, context)
+
+    def __len__(self, context=None):
+        return self.connection.execute("SELECT COUNT(*) FROM triples").fetchone()[0]
+
+    def contexts(self, triple=None):
+        return iter(())
+
+    def bind(self, prefix, namespace, override=True):
+        if self.read_only:
+            return
+        if not override and self.namespace(prefix) is not None:
+            return
+        with self.connection:
+            self.connection.execute("DELETE FROM namespaces WHERE uri = ?", (str(namespace),))
+            self.connection.execute("INSERT OR REPLACE INTO namespaces (prefix, uri) VALUES (?, ?)", (prefix, str(namespace)))
+
+    def namespace(self, prefix):
+        row = self.connection.execute("SELECT uri FROM namespaces WHERE prefix = ?", (prefix,)).fetchone()
+        return URIRef(row[0]) if row else None
+
+    def prefix(self, namespace):
+        row = self.connection.execute("SELECT prefix FROM namespaces WHERE uri = ?", (str(namespace),)).fetchone()
+        return row[0] if row else None
+
+    def namespaces(self):
+        for prefix, uri in self.connection.execute("SELECT prefix, uri FROM namespaces").fetchall():
+            yield prefix, URIRef(uri)
+
+def open_graph(path, read_only=False, clear=False):
+    """An rdflib Graph backed by the SQLite database at path (emptied first with clear=True)"""
+    store = SQLiteStore(path, read_only=read_only)
+    if clear:
+        store.clear()
+    return Graph(store=store)
+
+def load_file(graph_file, db_path, batch_size=100000):
+    """Bulk-load a graph file into a SQLite store, replacing its contents; N-Triples are streamed
+    without an in-memory graph"""
+    store = SQLiteStore(db_path)
+    store.clear()
+    if graph_file.lower().endswith(".nt"):
+        with open(graph_file, 'r', encoding="utf-8") as f:
+            loaded = store.bulk_load((triple for triple in map(parse_nt_line, f) if triple is not None), batch_size)
+    else:
+        import graph_io
+        loaded = store.bulk_load(graph_io.load_graph(graph_file), batch_size)
+    store.close()
+    print(f"Loaded {loaded} triples from {graph_file} into {db_path}")
+    return loaded
@@ -0,0 +1,250 @@
+import os
+import json
+import numpy as np
+
+try:
+    import hnswlib
+except ImportError:  # optional, only needed for kind="hnsw"
+    hnswlib = None
+
+# Below this many vectors a brute-force scan is fast enough and exact
+EXACT_MAX_VECTORS = 50000
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+def _top_k(scores, ids, k):
+    """(id, score) pairs of the k highest scores, best first"""
+    if len(scores) > k:
+        best = np.argpartition(-scores, k - 1)[:k]
+    else:
+        best = np.arange(len(scores))
+    best = best[np.argsort(-scores[best])]
+    return [(int(ids[i]), float(scores[i])) for i in best]
+
+class ExactIndex:
+    """Brute-force cosine similarity over all vectors"""
+
+    kind = "exact"
+
+    def __init__(self, dim):
+        self.dim = dim
+        self.vectors = np.empty((0, dim), dtype=np.float32)
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def add(self, vectors):
+        """Append vectors; their ids continue from the current size"""
+        self.vectors = np.concatenate([self.vectors, _normalize(vectors)])
+
+    def search(self, queries, k=1):
+        """For each query vector, the k most similar ids as [(id, cosine score), ...]"""
+        queries = _normalize(queries)
+        k = min(k, len(self))
+        if k == 0:
+            return [[] for _ in queries]
+        ids = np.arange(len(self))
+        return [_top_k(scores, ids, k) for scores in queries @ self.vectors.T]
+
+    def _params(self):
+        return {"dim": self.dim}
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "vectors.npy"), self.vectors)
+        with open(os.path.join(path, "meta.json"), 'w') as f:
+            json.dump({"kind": self.kind, **self._params()}, f)
+
+    @classmethod
+    def _load(cls, path, meta):
+        index = cls(meta["dim"])
+        index.vectors = np.load(os.path.join(path, "vectors.npy"))
+        return index
+
+class IVFIndex:
+    """Inverted-file index: vectors are bucketed under the nearest of nlist k-means centroids
+    and a search only scores the buckets of the nprobe closest centroids.
+
+    nprobe trades recall for latency and can be changed at any time. With quantize=True
+    vectors are kept as int8 with a per-vector scale, a quarter of the float32 size. New
+    vectors are added to their nearest bucket without retraining.
+    """
+
+    kind = "ivf"
+
+    def __init__(self, dim, nlist=None, nprobe=8, quantize=False, seed=42):
+        self.dim = dim
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.quantize = quantize
+        self.seed = seed
+        self.centroids = None
+        self.vectors = np.empty((0, dim), dtype=np.int8 if quantize else np.float32)
+        self.scales = np.empty(0, dtype=np.float32)
+        self.assignments = np.empty(0, dtype=np.int32)
+        self._buckets = None
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def train(self, vectors, iterations=10):
+        """Spherical k-means on (a sample of) vectors to place the centroids"""
+        vectors = _normalize(vectors)
+        rng = np.random.default_rng(self.seed)
+        nlist = self.nlist or int(np.clip(4 * np.sqrt(len(vectors)), 1, 65536))
+        nlist = min(nlist, len(vectors))
+        sample = vectors[rng.choice(len(vectors), min(len(vectors), nlist * 64), replace=False)]
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)]
+        for _ in range(iterations):
+            assignment = self._nearest(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            empty = np.bincount(assignment, minlength=nlist) == 0
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+            centroids = _normalize(sums)
+        self.nlist = nlist
+        self.centroids = centroids
+
+    @staticmethod
+    def _nearest(vectors, centroids, chunk=10000):
+        return np.concatenate([
+            np.argmax(vectors[start:start + chunk] @ centroids.T, axis=1)
+            for start in range(0, len(vectors), chunk)
+        ]).astype(np.int32) if len(vectors) else np.empty(0, dtype=np.int32)
+
+    def add(self, vectors):
+        vectors = _normalize(vectors)
+        if self.centroids is None:
+            self.train(vectors)
+        self.assignments = np.concatenate([self.assignments, self._nearest(vectors, self.centroids)])
+        if self.quantize:
+            scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127
+            self.vectors = np.concatenate([self.vectors, np.round(vectors / scales[:, None]).astype(np.int8)])
+            self.scales = np.concatenate([self.scales, scales.astype(np.float32)])
+        else:
+            self.vectors = np.concatenate([self.vectors, vectors])
+        self._buckets = None
+
+    def _bucket_ids(self):
+        """Ids grouped by centroid (CSR layout), rebuilt lazily after adds"""
+        if self._buckets is None:
+            order = np.argsort(self.assignments, kind="stable")
+            offsets = np.concatenate([[0], np.cumsum(np.bincount(self.assignments, minlength=self.nlist))])
+            self._buckets = (order, offsets)
+        return self._buckets
+
+    def search(self, queries, k=1, nprobe=None):
+        queries = _normalize(queries)
+        if not len(self):
+            return [[] for _ in queries]
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        order, offsets = self._bucket_ids()
+        results = []
+        for query in queries:
+            probes = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+            ids = np.concatenate([order[offsets[c]:offsets[c + 1]] for c in probes])
+            if not len(ids):
+                results.append([])
+                continue
+            scores = self.vectors[ids].astype(np.float32) @ query
+            if self.quantize:
+                scores *= self.scales[ids]
+            results.append(_top_k(scores, ids, min(k, len(ids))))
+        return results
+
+    def _params(self):
+        return {"dim": self.dim, "nlist": self.nlist, "nprobe": self.nprobe, "quantize": self.quantize, "seed": self.seed}
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        np.savez(os.path.join(path, "ivf.npz"), centroids=self.centroids, vectors=self.vectors,
+                 scales=self.scales, assignments=self.assignments)
+        with open(os.path.join(path, "meta.json"), 'w') as f:
+            json.dump({"kind": self.kind, **self._params()}, f)
+
+    @classmethod
+    def _load(cls, path, meta):
+        index = cls(meta["dim"], meta["nlist"], meta["nprobe"], meta["quantize"], meta["seed"])
+        with np.load(os.path.join(path, "ivf.npz")) as data:
+            index.centroids = data["centroids"]
+            index.vectors = data["vectors"]
+            index.scales = data["scales"]
+            index.assignments = data["assignments"]
+        return index
+
+class HNSWIndex:
+    """Hierarchical navigable small world graph (hnswlib); ef is the search-time recall knob"""
+
+    kind = "hnsw"
+
+    def __init__(self, dim, M=16, ef_construction=200, ef=64):
+        if hnswlib is None:
+            raise ImportError("The hnsw vector index needs the hnswlib package (pip install hnswlib)")
+        self.dim = dim
+        self.M = M
+        self.ef_construction = ef_construction
+        self.ef = ef
+        self.index = hnswlib.Index(space="ip", dim=dim)
+        self.index.init_index(max_elements=1024, ef_construction=ef_construction, M=M)
+        self.index.set_ef(ef)
+
+    def __len__(self):
+        return self.index.get_current_count()
+
+    def add(self, vectors):
+        vectors = _normalize(vectors)
+        start = len(self)
+        if start + len(vectors) > self.index.get_max_elements():
+            self.index.resize_index(max(2 * self.index.get_max_elements(), start + len(vectors)))
+        self.index.add_items(vectors, np.arange(start, start + len(vectors)))
+
+    def search(self, queries, k=1, ef=None):
+        queries = _normalize(queries)
+        k = min(k, len(self))
+        if k == 0:
+            return [[] for _ in queries]
+        self.index.set_ef(max(ef or self.ef, k))
+        labels, distances = self.index.knn_query(queries, k=k)
+        # Inner-product distance is 1 - cosine for normalized vectors
+        return [[(int(i), float(1 - d)) for i, d in zip(row_ids, row_distances)]
+                for row_ids, row_distances in zip(labels, distances)]
+
+    def _params(self):
+        return {"dim": self.dim, "M": self.M, "ef_construction": self.ef_construction, "ef": self.ef}
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        self.index.save_index(os.path.join(path, "hnsw.bin"))
+        with open(os.path.join(path, "meta.json"), 'w') as f:
+            json.dump({"kind": self.kind, **self._params()}, f)
+
+    @classmethod
+    def _load(cls, path, meta):
+        index = cls(meta["dim"], meta["M"], meta["ef_construction"], meta["ef"])
+        index.index.load_index(os.path.join(path, "hnsw.bin"))
+        index.index.set_ef(index.ef)
+        return index
+
+INDEX_TYPES = {cls.kind: cls for cls in (ExactIndex, IVFIndex, HNSWIndex)}
+
+def create_index(dim, kind="auto", size=0, **options):
+    """A vector index for about `size` vectors; "auto" picks exact for small sets, else HNSW
+    if hnswlib is installed, else IVF"""
+    if kind == "auto":
+        if size <= EXACT_MAX_VECTORS:
+            kind = "exact"
+        else:
+            kind = "hnsw" if hnswlib is not None else "ivf"
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Unknown vector index '{kind}', expected 'auto' or one of {sorted(INDEX_TYPES)}")
+    return INDEX_TYPES[kind](dim, **options)
+
+def load_index(path):
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+    return INDEX_TYPES[meta["kind"]]._load(path, meta)